@@ -1,73 +1,351 @@
-import csv
 import os
-import shutil
-import zipfile
+import sys
+import threading
+import time
 from datetime import datetime
-from logger import log_message
+from logger import log_message, get_log, flush_logs, human_size
+
+# Every scheduled run starts a fresh interpreter, so only what startup needs is imported
+# here; the catalog, the copy engine and the rest are imported by the functions using
+# them (benchmark.py startup checks the budget).
 
-# SCHEDULE_CSV = "schedules.csv"
-# PATHS_CSV = "paths.csv"
 # LOG_CSV = "backup_log.csv"
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-SCHEDULE_CSV = os.path.join(SCRIPT_DIR, 'schedules.csv')
-PATHS_CSV = os.path.join(SCRIPT_DIR, 'paths.csv')
 LOG_CSV = os.path.join(SCRIPT_DIR, 'backup_log.csv')
+METRICS_FILE = os.path.join(SCRIPT_DIR, 'backup_metrics.prom')
+PROGRESS_INTERVAL = 0.5        # seconds between --progress lines
+LOG_HEADER = ["DateTime","TaskName","Source","Destination","BackupType","Status","Message"]
 
-log_message("Backup Process Started.")
-
-def load_enabled_schedule():
+def load_index():
+    # One catalog read per process; every schedule run by this process resolves tasks from it
+    import catalog
     try:
-        if not os.path.exists(SCHEDULE_CSV):
-            log_message("No schedule CSV found")
-            return None
-        with open(SCHEDULE_CSV, newline='', encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get("Enabled", "").strip().lower() == "yes":
-                    return row
-        return None
+        schedules = {s["Schedule Name"]: s for s in catalog.get_schedules()}
+        tasks = {}
+        for t in catalog.get_tasks():
+            tasks.setdefault(t["task_name"], []).append(t)
+        return schedules, tasks
     except Exception as e:
-        log_message(f"Error in load_enabled_schedule: {e}")
-        return None
+        log_message(f"Error in load_index: {e}")
+        return {}, {}
+
+def schedule_enabled(schedule):
+    return schedule.get("Enabled", "").strip().lower() == "yes"
+
+def tasks_for_schedule(schedule, task_index):
+    task_names = [t.strip() for t in schedule.get("Selected Tasks", "").split(",") if t.strip()]
+    return [t for name in task_names for t in task_index.get(name, [])]
+
+def select_schedules(names, schedules, include_disabled=False):
+    if not names:
+        return [s for s in schedules.values() if schedule_enabled(s)]
+    selected = []
+    for name in names:
+        schedule = schedules.get(name)
+        if schedule is None:
+            # Schedules created before the XML passed the schedule name pass its task list instead
+            log_message(f"No schedule named '{name}', running it as a task list")
+            selected.append({"Schedule Name": name, "Enabled": "Yes", "Selected Tasks": name})
+        elif not schedule_enabled(schedule) and not include_disabled:
+            log_message(f"Schedule '{name}' is disabled, skipping")
+        else:
+            selected.append(schedule)
+    return selected
+
+def run_schedule(schedule, task_index):
+    log_message(f"Running schedule: {schedule['Schedule Name']}")
+    tasks = tasks_for_schedule(schedule, task_index)
+    if not tasks:
+        log_message(f"No matching tasks found for schedule '{schedule['Schedule Name']}'")
+        return
+    from throttle import schedule_throttle, UNLIMITED
+    try:
+        throttle = schedule_throttle(schedule)
+    except ValueError as e:
+        log_message(f"Ignoring throttle settings of schedule '{schedule['Schedule Name']}': {e}")
+        throttle = UNLIMITED
+    limits = (task_int(schedule, "Max Parallel", 1), task_int(schedule, "Max Per Volume", 1), throttle)
+    priority = str(schedule.get("IO Priority") or "normal").strip().lower()
+    if priority == "normal":
+        run_tasks(tasks, *limits)
+    else:
+        # A lowered priority sticks to its thread, so run in one that ends with the schedule
+        worker = threading.Thread(target=run_tasks_at_priority, args=(priority, tasks, limits))
+        worker.start()
+        worker.join()
+    prune_snapshots(schedule, tasks)
+
+def prune_snapshots(schedule, tasks):
+    if not any(task_flag(t, "Snapshots") for t in tasks):
+        return
+    from snapshots import prune_schedule
+    prune_schedule(schedule, tasks)
 
-def load_tasks_for_schedule(selected_tasks):
+def run_tasks_at_priority(priority, tasks, limits):
+    from throttle import lower_priority
+    restore = None
     try:
-        if not os.path.exists(PATHS_CSV):
-            log_message("No paths CSV found")
-            return []
-        task_names = [t.strip() for t in selected_tasks.split(",") if t.strip()]
-        matched_tasks = []
-        with open(PATHS_CSV, newline='', encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row["task_name"] in task_names:
-                    matched_tasks.append(row)
-        return matched_tasks
+        restore = lower_priority(priority)
     except Exception as e:
-        log_message(f"Error in load_tasks_for_schedule: {e}")
-        return []
+        log_message(f"Error lowering priority: {e}")
+    try:
+        run_tasks(tasks, *limits)
+    finally:
+        if restore is not None:
+            try:
+                restore()
+            except Exception as e:
+                log_message(f"Error restoring priority: {e}")
+
+def task_flag(task, key):
+    return str(task.get(key) or "").strip().lower() in ("true", "1", "yes")
+
+def task_int(task, key, default):
+    try:
+        return int(str(task.get(key) or "").strip())
+    except ValueError:
+        return default
 
-def copy_folder(src, dst):
+def report_copy_errors(errors):
+    for path, error in errors:
+        log_message(f"Failed to copy '{path}': {error}")
+
+def copy_folder(src, dst, workers=1, include=None, exclude=None, backend="copy2", task_name=None, hashes=None):
+    import shutil
+    from collections import Counter
+    from checkpoint import Journal, journal_path
+    from copy_engine import walk_copy_jobs, copy_files, make_copier, describe_methods
+    from metrics import current as current_metrics
+    from throttle import current as current_throttle
     try:
         if not os.path.exists(src):
             log_message(f"Source path '{src}' does not exist")
             return False, f"Source path '{src}' does not exist"
         if not os.path.exists(dst):
             os.makedirs(dst)
-        for item in os.listdir(src):
-            s_path = os.path.join(src, item)
-            d_path = os.path.join(dst, item)
-            if os.path.isdir(s_path):
-                shutil.copytree(s_path, d_path, dirs_exist_ok=True)
-            else:
-                shutil.copy2(s_path, d_path)
-        return True, "Copied successfully"
+        dir_pairs = []
+        m = current_metrics()
+        jobs = m.timed(walk_copy_jobs(src, dst, dir_pairs, include, exclude), "scan")
+        journal = Journal(journal_path(dst, task_name)) if task_name else None
+        resumed = 0
+        if journal is not None and journal.exists():
+            # Skip what an interrupted run already copied, unless it changed since
+            done = {r["f"]: (r["s"], r["m"]) for r in journal.load() if "f" in r}
+
+            def remaining(jobs):
+                nonlocal resumed
+                for job in jobs:
+                    st = job[3].stat
+                    if st and done.get(job[3].rel_path) == (st.st_size, st.st_mtime_ns) \
+                            and os.path.exists(job[1]):
+                        resumed += 1
+                        m.skip(1, st.st_size)
+                        continue
+                    yield job
+            jobs = remaining(jobs)
+        methods = Counter()
+
+        def on_copied(job, method):
+            methods[method] += 1
+            m.count(1, job[2])
+            if journal is not None and job[3].stat:
+                journal.add({"f": job[3].rel_path, "s": job[3].stat.st_size, "m": job[3].stat.st_mtime_ns})
+                if journal.due():
+                    journal.flush()
+
+        jobs = current_throttle().limit(jobs, lambda job: job[2])
+        copied, copied_bytes, errors = copy_files(jobs, workers, make_copier(backend, m, hashes), on_copied)
+        with m.phase("finalize"):
+            for s_dir, d_dir in reversed(dir_pairs):
+                shutil.copystat(s_dir, d_dir)
+        note = f", resumed past {resumed} files copied by an interrupted run" if resumed else ""
+        if errors:
+            if journal is not None:
+                journal.flush()
+            report_copy_errors(errors)
+            return False, f"Copied {copied} files ({human_size(copied_bytes)}) via {describe_methods(methods)}, {len(errors)} failed{note}"
+        if journal is not None:
+            journal.clear()
+        if backend and backend.lower() != "copy2":
+            return True, f"Copied successfully via {describe_methods(methods)}{note}"
+        return True, f"Copied successfully{note}"
     except Exception as e:
         log_message(f"Error in copy_folder: {e}")
         return False, str(e)
 
-def zip_folder(src, dst):
+def link_unchanged(b_path, d_path):
+    # A new snapshot shares unchanged files with the previous one instead of copying them
+    if os.path.lexists(d_path):
+        if os.path.samefile(b_path, d_path):
+            return
+        os.remove(d_path)
+    os.link(b_path, d_path)
+
+def incremental_copy(src, dst, task_name, use_hash=False, workers=1, include=None, exclude=None,
+                     backend="copy2", hashes=None, base=None, changes=None):
+    import shutil
+    from collections import Counter
+    from checkpoint import CHECKPOINT_SECONDS
+    from copy_engine import copy_files, make_copier, describe_methods
+    from manifest import manifest_path, load_manifest, save_manifest, file_hash
+    from metrics import current as current_metrics
+    from throttle import current as current_throttle
+    from tree_walker import walk_tree
+    try:
+        if not os.path.exists(src):
+            log_message(f"Source path '{src}' does not exist")
+            return False, f"Source path '{src}' does not exist"
+        if not os.path.isdir(src):
+            log_message(f"Source path '{src}' is not a directory")
+            return False, f"Source path '{src}' is not a directory"
+        m_path = manifest_path(dst, task_name)
+        try:
+            old_manifest = load_manifest(manifest_path(base, task_name) if base else m_path)
+            # A snapshot resumed after an interrupted run already holds what that run copied
+            # or linked; its own checkpoint manifest records those files
+            resumed = load_manifest(m_path) if base else {}
+        except Exception as e:
+            log_message(f"Manifest '{m_path}' unreadable, doing a full copy: {e}")
+            old_manifest = resumed = {}
+        new_manifest = {}
+        if changes is None:
+            items = walk_tree(src, include, exclude, dirs=True)
+        else:
+            # Only the paths the change journal recorded; the rest of the manifest stands
+            from change_watch import journal_entries, drop_journaled
+            items = journal_entries(src, changes, include, exclude)
+            new_manifest = drop_journaled(old_manifest, changes)
+        pending_entries = {}
+        skipped = skipped_bytes = 0
+
+        def changed_files():
+            nonlocal skipped, skipped_bytes
+            os.makedirs(dst, exist_ok=True)
+            for item in items:
+                d_path = os.path.join(dst, *item.rel_path.split("/"))
+                b_path = os.path.join(base, *item.rel_path.split("/")) if base else d_path
+                if item.is_dir:
+                    os.makedirs(d_path, exist_ok=True)
+                    continue
+                st = item.stat
+                if st is None:
+                    yield item.path, d_path, 0
+                    continue
+                entry = {"size": st.st_size, "mtime": st.st_mtime_ns}
+                prev = resumed.get(item.rel_path)
+                if prev and prev.get("size") == st.st_size and prev.get("mtime") == st.st_mtime_ns \
+                        and os.path.exists(d_path):
+                    # Already in this snapshot; linking from base could swap in an older version
+                    b_path = d_path
+                else:
+                    prev = old_manifest.get(item.rel_path)
+                unchanged = False
+                if prev and prev.get("size") == st.st_size and os.path.exists(b_path):
+                    if prev.get("mtime") == st.st_mtime_ns:
+                        unchanged = True
+                        if prev.get("hash"):
+                            entry["hash"] = prev["hash"]
+                    elif use_hash and prev.get("hash") and b_path == d_path:
+                        # Touched but identical content: keep the copy, refresh its timestamps.
+                        # A file of an earlier snapshot is never touched (its hard links would
+                        # change every snapshot sharing it), so with a base it is copied anew.
+                        if file_hash(item.path) == prev["hash"]:
+                            shutil.copystat(item.path, b_path)
+                            entry["hash"] = prev["hash"]
+                            unchanged = True
+                if unchanged and b_path != d_path:
+                    try:
+                        link_unchanged(b_path, d_path)
+                    except OSError:
+                        unchanged = False
+                if unchanged:
+                    if hashes is not None and entry.get("hash"):
+                        hashes[item.path] = entry["hash"]
+                    skipped += 1
+                    skipped_bytes += st.st_size
+                    m.skip(1, st.st_size)
+                    new_manifest[item.rel_path] = entry
+                else:
+                    if base and os.path.lexists(d_path):
+                        # May be a link into the previous snapshot; copying over it would change both
+                        os.remove(d_path)
+                    pending_entries[item.path] = (item.rel_path, entry)
+                    yield item.path, d_path, st.st_size
+
+        m = current_metrics()
+        copy_hashes = hashes if hashes is not None else ({} if use_hash else None)
+        copier = make_copier(backend, m, copy_hashes)
+        methods = Counter()
+
+        def copy_one(s_path, d_path):
+            method = copier(s_path, d_path)
+            digest = None
+            if copy_hashes is not None:
+                digest = copy_hashes.get(s_path) if hashes is not None else copy_hashes.pop(s_path, None)
+            if use_hash and digest is None:
+                digest = file_hash(s_path)
+            return method, digest
+
+        last_checkpoint = time.monotonic()
+
+        def on_copied(job, result):
+            nonlocal last_checkpoint
+            method, digest = result
+            methods[method] += 1
+            m.count(1, job[2])
+            if job[0] not in pending_entries:
+                return
+            rel_path, entry = pending_entries.pop(job[0])
+            if digest:
+                entry["hash"] = digest
+            new_manifest[rel_path] = entry
+            if time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+                # Checkpoint: an interrupted run resumes from here as an ordinary incremental run
+                save_manifest(m_path, {**old_manifest, **resumed, **new_manifest})
+                last_checkpoint = time.monotonic()
+
+        jobs = current_throttle().limit(m.timed(changed_files(), "scan"), lambda job: job[2])
+        copied, copied_bytes, errors = copy_files(jobs, workers, copy_one, on_copied)
+        # Failed files stay out of the manifest so the next run retries them
+        with m.phase("finalize"):
+            save_manifest(m_path, new_manifest)
+        msg = (f"Copied {copied} files ({human_size(copied_bytes)}), "
+               f"skipped {skipped} unchanged files ({human_size(skipped_bytes)})")
+        if changes is not None:
+            msg += f" from {len(changes)} journaled changes"
+        if methods and backend and backend.lower() != "copy2":
+            msg += f" via {describe_methods(methods)}"
+        if errors:
+            report_copy_errors(errors)
+            return False, f"{msg}, {len(errors)} failed"
+        return True, msg
+    except Exception as e:
+        log_message(f"Error in incremental_copy: {e}")
+        return False, str(e)
+
+def zip_members(src, include=None, exclude=None):
+    from tree_walker import walk_tree
+    for entry in walk_tree(src, include, exclude):
+        yield entry.path, entry.rel_path, entry.stat
+
+def zip_settings_for_task(task):
+    level = task_int(task, "CompressionLevel", None)
+    from zip_engine import zip_settings
+    return zip_settings(task.get("Compression"), level, task.get("StoreRule"), task.get("StoreExtensions"))
+
+def tar_settings_for_task(task):
+    from tar_engine import tar_settings
+    from throttle import parse_size
+    return tar_settings(task.get("Compression"), task_int(task, "CompressionLevel", None),
+                        task_int(task, "Workers", 1), parse_size(task.get("VolumeSize")))
+
+def zip_path_for(src, dst):
+    return os.path.join(dst, os.path.basename(src) + ".zip")
+
+def zip_folder(src, dst, workers=1, settings=None, include=None, exclude=None, task_name=None):
+    from checkpoint import Journal, journal_path
+    from metrics import current as current_metrics
     try:
         if not os.path.exists(src):
             log_message(f"Source path '{src}' does not exist")
@@ -77,54 +355,279 @@ def zip_folder(src, dst):
             return False, f"Source path '{src}' is not a directory"
         if not os.path.exists(dst):
             os.makedirs(dst)
-        zip_path = os.path.join(dst, os.path.basename(src) + ".zip")
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(src):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, src)
-                    zipf.write(full_path, arcname=rel_path)
+        zip_path = zip_path_for(src, dst)
+        journal = Journal(journal_path(dst, task_name)) if task_name else None
+        members = current_metrics().timed(zip_members(src, include, exclude), "scan")
+        from zip_engine import write_zip
+        resumed = write_zip(members, zip_path, workers, settings, journal)
+        if resumed:
+            return True, f"Zipped to: {zip_path} (resumed after {resumed} members)"
         return True, f"Zipped to: {zip_path}"
     except Exception as e:
         log_message(f"Error in zip_folder: {e}")
         return False, str(e)
 
+def tar_folder(src, dst, settings, include=None, exclude=None):
+    from metrics import current as current_metrics
+    from tree_walker import walk_tree
+    try:
+        if not os.path.isdir(src):
+            log_message(f"Source path '{src}' is not a directory")
+            return False, f"Source path '{src}' is not a directory"
+        os.makedirs(dst, exist_ok=True)
+        from tar_engine import write_tar, tar_path_for
+        archive = tar_path_for(src, dst, settings)
+        entries = current_metrics().timed(walk_tree(src, include, exclude, dirs=True), "scan")
+        volumes, errors = write_tar(entries, archive, settings)
+        msg = f"Archived to: {archive}"
+        if len(volumes) > 1:
+            msg += f" ({len(volumes)} volumes)"
+        if errors:
+            report_copy_errors(errors)
+            return False, f"{msg}, {len(errors)} files unreadable"
+        return True, msg
+    except Exception as e:
+        log_message(f"Error in tar_folder: {e}")
+        return False, str(e)
+
+def verify_backup(t, backup_type, hashes, workers, include=None, exclude=None):
+    from manifest import file_hash
+    from verify import verify_tree, verify_zip, write_checksums, checksums_path, VERIFY_WORKERS
+    workers = workers or VERIFY_WORKERS
+    task_name = t["task_name"]
+    source = t["source"]
+    dest = t["backup"]
+    try:
+        if backup_type == "dedup":
+            from dedup_store import verify_snapshot
+            name, problems = verify_snapshot(dest, task_name, src=source)
+            target = f"snapshot {name}"
+        elif backup_type in ("zip", "differential"):
+            if backup_type == "zip":
+                zip_path = zip_path_for(source, dest)
+            else:
+                from zip_chain import load_chain
+                chain = load_chain(dest, task_name, source)
+                if not chain:
+                    return False, f"Verify failed: no archive of {task_name} from '{source}' in '{dest}'"
+                zip_path = os.path.join(dest, chain[-1]["archive"])
+            members, problems = verify_zip(zip_path, workers)
+            write_checksums(zip_path + ".sha256", {os.path.basename(zip_path): file_hash(zip_path)})
+            target = f"{members} members of {os.path.basename(zip_path)}"
+        elif backup_type == "tar":
+            from tar_engine import verify_tar, tar_path_for, archive_volumes
+            archive = tar_path_for(source, dest, tar_settings_for_task(t))
+            members, problems = verify_tar(archive)
+            write_checksums(archive + ".sha256", {os.path.basename(v): file_hash(v) for v in archive_volumes(archive)})
+            target = f"{members} members of {os.path.basename(archive)}"
+        else:
+            checksums, problems, reused = verify_tree(source, dest, hashes, workers, include, exclude)
+            write_checksums(checksums_path(dest, task_name), checksums)
+            target = f"{len(checksums)} files ({reused} source hashes reused from the copy)"
+        for problem in problems[:20]:
+            log_message(f"Verify {task_name}: {problem}")
+        if problems:
+            return False, f"Verify failed: {len(problems)} problems in {target}"
+        return True, f"Verified {target}"
+    except Exception as e:
+        log_message(f"Error in verify_backup: {e}")
+        return False, f"Verify failed: {e}"
+
+def csv_line(row):
+    import csv
+    import io
+    buf = io.StringIO()
+    csv.writer(buf).writerow(row)
+    return buf.getvalue()
+
 def log_execution(task_name, source, dest, backup_type, status, message):
     try:
-        is_new = not os.path.exists(LOG_CSV)
-        with open(LOG_CSV, "a", newline='', encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if is_new:
-                writer.writerow(["DateTime","TaskName","Source","Destination","BackupType","Status","Message"])
-            writer.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), task_name, source, dest, backup_type, status, message])
+        # One buffered row per call; rows from concurrent tasks never interleave
+        row = [datetime.now().strftime("%Y-%m-%d %H:%M:%S"), task_name, source, dest, backup_type, status, message]
+        log = get_log(LOG_CSV, header=csv_line(LOG_HEADER), newline='')
+        log.write(csv_line(row))
+        import catalog
+        catalog.log_run(*row)
     except Exception as e:
         log_message(f"Error in log_execution: {e}")
 
-def main():
+def run_task(t, throttle=None):
+    from manifest import manifest_path
+    from metrics import start_task as start_metrics
+    from throttle import start_task as start_throttle, UNLIMITED
+    from tree_walker import parse_patterns
+    task_name = t["task_name"]
+    source = t["source"]
+    dest = t["backup"]
+    backup_type = t.get("BackupType", "normal").lower()
+    verify = task_flag(t, "Verify")
+    hashes = {} if verify else None
+    metrics = snapshot_id = base = include = exclude = None
     try:
-        schedule = load_enabled_schedule()
-        if schedule is None:
-            log_message("No enabled schedule found")
+        # Set up inside the try: a bad limit or pattern fails this task with a log row
+        # instead of ending the worker thread
+        metrics = start_metrics(task_name, backup_type)
+        start_throttle((throttle or UNLIMITED).for_task(t, metrics))
+        workers = task_int(t, "Workers", 1)
+        include = parse_patterns(t.get("Include"))
+        exclude = parse_patterns(t.get("Exclude"))
+        backend = t.get("CopyBackend") or "copy2"
+        log_message(f"Running task: {task_name} (Backup type: {backup_type})")
+        if task_flag(t, "Snapshots"):
+            from snapshots import start_snapshot, SNAPSHOT_TYPES
+            if backup_type in SNAPSHOT_TYPES:
+                # Each run writes a new timestamped folder under the destination
+                snapshot_id, dest, base = start_snapshot(task_name, dest)
+                t = dict(t, backup=dest)
+            else:
+                log_message(f"Task {task_name}: {backup_type} backups keep their own history, ignoring Snapshots")
+        # Engines other than plain copying are imported on first use, so a scheduled
+        # run only pays for the modes it actually runs
+        if backup_type == "zip":
+            status, msg = zip_folder(source, dest, workers, zip_settings_for_task(t), include, exclude, task_name)
+        elif backup_type == "differential":
+            from zip_chain import differential_zip, DEFAULT_FULL_EVERY
+            status, msg = differential_zip(source, dest, task_name, workers, zip_settings_for_task(t),
+                                           task_int(t, "FullEvery", DEFAULT_FULL_EVERY), include, exclude)
+        elif backup_type == "dedup":
+            from dedup_store import dedup_backup
+            status, msg = dedup_backup(source, dest, task_name, include, exclude)
+        elif backup_type == "tar":
+            status, msg = tar_folder(source, dest, tar_settings_for_task(t), include, exclude)
+        elif backup_type == "mirror":
+            from mirror import mirror_folder
+            status, msg = mirror_folder(source, dest, task_name, workers, include, exclude, backend, hashes,
+                                        t.get("Trash"))
+        elif backup_type == "incremental":
+            journal = None
+            if task_flag(t, "Watch") and snapshot_id is None:
+                from change_watch import read_journal, finish_journal, FULL_SCAN_HOURS
+                journal = read_journal(task_name, source, task_int(t, "FullScanEvery", FULL_SCAN_HOURS),
+                                       os.path.exists(manifest_path(dest, task_name)))
+            status, msg = incremental_copy(source, dest, task_name, task_flag(t, "Hash"), workers,
+                                           include, exclude, backend, hashes, base, journal and journal[2])
+            if status and journal:
+                finish_journal(task_name, source, journal)
+        else:
+            status, msg = copy_folder(source, dest, workers, include, exclude, backend, task_name, hashes)
+    except Exception as e:
+        log_message(f"Error in run_task: {e}")
+        status, msg = False, str(e)
+    log_execution(task_name, source, dest, backup_type, "Success" if status else "Failed", msg)
+    log_message(f"Task {task_name} completed: {msg}")
+    if status and verify:
+        with metrics.phase("verify"):
+            status, msg = verify_backup(t, backup_type, hashes, task_int(t, "VerifyWorkers", 0),
+                                        include, exclude)
+        log_execution(task_name, source, dest, "verify", "Success" if status else "Failed", msg)
+        log_message(f"Task {task_name} verify: {msg}")
+    if snapshot_id is not None:
+        from snapshots import finish_snapshot
+        try:
+            finish_snapshot(snapshot_id, status)
+        except Exception as e:
+            log_message(f"Error recording snapshot of {task_name}: {e}")
+    if metrics is not None:
+        metrics.finish(status)
+    return status
+
+def volume_key(path):
+    path = os.path.abspath(path)
+    drive = os.path.splitdrive(path)[0]
+    if drive:
+        return drive.lower()
+    # No drive letter (Linux/macOS): tasks on the same device share a volume
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+def run_tasks(tasks, max_parallel=1, max_per_volume=1, throttle=None):
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    max_parallel = max(1, max_parallel)
+    max_per_volume = max(1, max_per_volume)
+    queue = [(t, volume_key(t["backup"])) for t in tasks]
+    running = {}
+    per_volume = {}
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        while queue or running:
+            for item in list(queue):
+                if len(running) >= max_parallel:
+                    break
+                t, volume = item
+                if per_volume.get(volume, 0) >= max_per_volume:
+                    continue
+                queue.remove(item)
+                per_volume[volume] = per_volume.get(volume, 0) + 1
+                running[pool.submit(run_task, t, throttle)] = volume
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                per_volume[running.pop(future)] -= 1
+                try:
+                    future.result()
+                except Exception as e:
+                    log_message(f"Error in run_tasks: {e}")
+
+def report_progress(stop, out=sys.stdout):
+    # One JSON line per interval with the counters of every task seen so far (for the GUI)
+    import json
+    from metrics import recent as recent_metrics
+    seen = {}
+    while True:
+        stopping = stop.wait(PROGRESS_INTERVAL)
+        for m in recent_metrics():
+            seen[id(m)] = m
+        out.write(json.dumps({"tasks": [m.progress() for m in seen.values()]}) + "\n")
+        out.flush()
+        if stopping:
             return
-        log_message(f"Running schedule: {schedule['Schedule Name']}")
-        tasks = load_tasks_for_schedule(schedule.get("Selected Tasks", ""))
-        if not tasks:
-            log_message("No matching tasks found for schedule")
+
+def terminated(signum, frame):
+    log_message("Backup Process terminated.")
+    flush_logs()
+    os._exit(128 + signum)
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run backup schedules")
+    parser.add_argument("schedules", nargs="*", help="Schedule names (default: every enabled schedule)")
+    parser.add_argument("--task", action="append", default=[], help="Run this task instead of a schedule")
+    parser.add_argument("--now", action="store_true", help="Run the named schedules even if disabled")
+    parser.add_argument("--progress", action="store_true", help="Print JSON progress lines to stdout")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    # The GUI cancels with terminate(): worker threads would finish the run before an
+    # exception could end it, so exit at once, keeping the log. Checkpoint journals let
+    # the next run resume.
+    import signal
+    signal.signal(signal.SIGTERM, terminated)
+    log_message("Backup Process Started.")
+    stop_progress = threading.Event()
+    reporter = None
+    if args.progress:
+        reporter = threading.Thread(target=report_progress, args=(stop_progress,), daemon=True)
+        reporter.start()
+    try:
+        schedules, task_index = load_index()
+        if args.task:
+            selected = [{"Schedule Name": "Run now", "Selected Tasks": ",".join(args.task)}]
+        else:
+            selected = select_schedules(args.schedules, schedules, args.now)
+        if not selected:
+            log_message("No enabled schedule found")
             return
-        for t in tasks:
-            task_name = t["task_name"]
-            source = t["source"]
-            dest = t["backup"]
-            backup_type = t.get("BackupType", "normal").lower()
-            log_message(f"Running task: {task_name} (Backup type: {backup_type})")
-            if backup_type == "zip":
-                status, msg = zip_folder(source, dest)
-            else:
-                status, msg = copy_folder(source, dest)
-            log_execution(task_name, source, dest, backup_type, "Success" if status else "Failed", msg)
-            log_message(f"Task {task_name} completed: {msg}")
+        for schedule in selected:
+            run_schedule(schedule, task_index)
     except Exception as e:
         log_message(f"Error in main: {e}")
+    finally:
+        if reporter is not None:
+            stop_progress.set()
+            reporter.join()
+        try:
+            from metrics import write_prometheus
+            write_prometheus(METRICS_FILE)
+        except Exception as e:
+            log_message(f"Error writing metrics: {e}")
+        flush_logs()
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,14 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-import csv
-import os
 
 from TaskScheduleForm import TaskScheduleForm
+from gui_runner import RunWindow
+import catalog
 
 
-GRID_CSV = "paths.csv"
+BACKUP_TYPES = ["Normal", "Zip", "Incremental", "Differential", "Dedup", "Mirror", "Tar"]
+TREE_BATCH = 200        # rows inserted per idle callback when a large task is loaded
+FILTER_DELAY_MS = 150
 
 class FileCopyMasterPage:
     def __init__(self, root):
@@ -17,7 +19,11 @@ class FileCopyMasterPage:
         self.source_path = tk.StringVar()
         self.dest_path = tk.StringVar()
         self.backup_type = tk.StringVar(value="Normal")  # New field; default to Normal
-        self.editing_index = None
+        self.editing_id = None
+        self.next_row_id = 0
+        self.pending_rows = []
+        self.fill_job = None
+        self.filter_job = None
 
         action_btn_frame = tk.Frame(root)
         action_btn_frame.grid(row=4, column=1, columnspan=4, sticky='w', padx=2, pady=2)
@@ -38,7 +44,7 @@ class FileCopyMasterPage:
 
         # Backup Type dropdown
         tk.Label(root, text="Backup Type").grid(row=3, column=0, sticky='w')
-        backup_type_combo = ttk.Combobox(root, textvariable=self.backup_type, values=["Normal", "Zip"], state="readonly", width=28)
+        backup_type_combo = ttk.Combobox(root, textvariable=self.backup_type, values=BACKUP_TYPES, state="readonly", width=28)
         backup_type_combo.grid(row=3, column=1, sticky='w', padx=2, pady=2)
 
         # Buttons
@@ -56,7 +62,10 @@ class FileCopyMasterPage:
         delete_btn.pack(side=tk.LEFT, padx=(0, 6))
 
         open_sched_btn = tk.Button(action_btn_frame, text="Open Scheduler", command=self.open_scheduler, width=13)
-        open_sched_btn.pack(side=tk.LEFT)
+        open_sched_btn.pack(side=tk.LEFT, padx=(0, 6))
+
+        run_btn = tk.Button(action_btn_frame, text="Run Now", command=self.run_now, width=9)
+        run_btn.pack(side=tk.LEFT)
 
 
         # Treeview
@@ -75,15 +84,21 @@ class FileCopyMasterPage:
         self.tree.bind("<Button-1>", self.on_tree_click)
         self.tree.bind("<Double-1>", self.handle_action)
 
-        self.entries = []
-        self.load_grid_from_csv()
-
-        # Task list
-        tk.Label(root, text="List of Task").grid(row=0, column=5, padx=10, sticky='nw')
-        self.task_list = tk.Listbox(root, height=20, width=25)
-        self.task_list.grid(row=1, column=5, rowspan=6, padx=10, sticky='n')
+        # Rows keyed by their Treeview item id, in display order
+        self.entries = {}
+        self.load_grid()
+
+        # Task list with search box
+        list_frame = tk.Frame(root)
+        list_frame.grid(row=0, column=5, rowspan=7, padx=10, sticky='n')
+        tk.Label(list_frame, text="List of Task").pack(anchor='w')
+        self.task_filter = tk.StringVar()
+        self.task_filter.trace_add("write", self.schedule_filter)
+        tk.Entry(list_frame, textvariable=self.task_filter, width=25).pack(anchor='w', pady=(0, 4))
+        self.task_list = tk.Listbox(list_frame, height=20, width=25)
+        self.task_list.pack()
         self.task_list.bind('<<ListboxSelect>>', self.on_task_select)
-        self.load_task_list_from_csv()
+        self.load_task_list()
 
     def browse_source(self):
         path = filedialog.askdirectory(title="Select Source Directory")
@@ -103,21 +118,69 @@ class FileCopyMasterPage:
         if not task or not src or not dst:
             messagebox.showerror("Error", "Task name, source and destination path must not be empty!")
             return
-        if self.editing_index is not None:
-            selected = self.entries[self.editing_index][4]
-            self.entries[self.editing_index] = (task, src, dst, backup_type, selected)
-            self.editing_index = None
+        if self.editing_id in self.entries:
+            selected = self.entries[self.editing_id][4]
+            self.entries[self.editing_id] = (task, src, dst, backup_type, selected)
+            self.update_row(self.editing_id)
+            self.editing_id = None
         else:
-            self.entries.append((task, src, dst, backup_type, False))
-        self.refresh_tree()
+            self.finish_fill()
+            row_id = self.new_row((task, src, dst, backup_type, False))
+            self.tree.insert('', 'end', iid=row_id, values=self.row_values(len(self.entries), self.entries[row_id]))
         self.reset_fields()
 
+    def new_row(self, entry):
+        self.next_row_id += 1
+        row_id = f"row{self.next_row_id}"
+        self.entries[row_id] = entry
+        return row_id
+
+    def row_values(self, position, entry):
+        task, src, dst, backup_type, selected = entry
+        sel_text = "[X]" if selected else "[ ]"
+        return (position, sel_text, task, src, dst, backup_type, "Edit/Delete")
+
+    def set_entries(self, entries):
+        self.entries = {}
+        for entry in entries:
+            self.new_row(entry)
+        self.refresh_tree()
+
     def refresh_tree(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        for idx, (task, src, dst, backup_type, selected) in enumerate(self.entries, start=1):
-            sel_text = "[X]" if selected else "[ ]"
-            self.tree.insert('', 'end', values=(idx, sel_text, task, src, dst, backup_type, "Edit/Delete"))
+        # Full rebuild, only when a whole task is loaded; rows are inserted in batches
+        # from idle callbacks so thousands of paths never freeze the window
+        if self.fill_job is not None:
+            self.root.after_cancel(self.fill_job)
+            self.fill_job = None
+        self.tree.delete(*self.tree.get_children())
+        self.pending_rows = list(self.entries.items())
+        self.fill_tree(TREE_BATCH)
+
+    def fill_tree(self, count):
+        position = len(self.tree.get_children())
+        batch, self.pending_rows = self.pending_rows[:count], self.pending_rows[count:]
+        for row_id, entry in batch:
+            position += 1
+            self.tree.insert('', 'end', iid=row_id, values=self.row_values(position, entry))
+        self.fill_job = self.root.after(1, self.fill_tree, TREE_BATCH) if self.pending_rows else None
+
+    def finish_fill(self):
+        # Rows added or removed while a load is still filling need the whole list in place
+        if self.fill_job is not None:
+            self.root.after_cancel(self.fill_job)
+            self.fill_tree(len(self.pending_rows))
+
+    def update_row(self, row_id):
+        if self.tree.exists(row_id):
+            self.tree.item(row_id, values=self.row_values(self.tree.set(row_id, '#'), self.entries[row_id]))
+
+    def delete_row(self, row_id):
+        self.finish_fill()
+        position = self.tree.index(row_id)
+        self.tree.delete(row_id)
+        del self.entries[row_id]
+        for number, later_id in enumerate(self.tree.get_children()[position:], start=position + 1):
+            self.tree.set(later_id, '#', number)
 
     def on_tree_click(self, event):
         row_id = self.tree.identify_row(event.y)
@@ -125,38 +188,32 @@ class FileCopyMasterPage:
         if not row_id:
             return
         if col == "#2":  # Select column clicked
-            item = self.tree.item(row_id)
-            values = list(item['values'])
-            index = int(values[0]) - 1
-            selected = self.entries[index][4]
-            self.entries[index] = (self.entries[index][0], self.entries[index][1], self.entries[index][2], self.entries[index][3], not selected)
-            self.refresh_tree()
+            task, src, dst, backup_type, selected = self.entries[row_id]
+            self.entries[row_id] = (task, src, dst, backup_type, not selected)
+            self.tree.set(row_id, 'Select', "[ ]" if selected else "[X]")
 
     def handle_action(self, event):
         row_id = self.tree.identify_row(event.y)
         col = self.tree.identify_column(event.x)
         if not row_id or col != "#7":  # Only edit/delete on Action column
             return
-        item = self.tree.item(row_id)
-        index = int(item['values'][0]) - 1
         result = messagebox.askquestion("Select Action", "Edit (Yes) or Delete (No)?", icon='question', type='yesno')
         if result == "yes":
-            task, src, dst, backup_type, selected = self.entries[index]
+            task, src, dst, backup_type, selected = self.entries[row_id]
             self.task_name.set(task)
             self.source_path.set(src)
             self.dest_path.set(dst)
             self.backup_type.set(backup_type)
-            self.editing_index = index
+            self.editing_id = row_id
         elif result == "no":
-            del self.entries[index]
-            self.refresh_tree()
+            self.delete_row(row_id)
 
     def reset_fields(self):
         self.task_name.set("")
         self.source_path.set("")
         self.dest_path.set("")
         self.backup_type.set("Normal")
-        self.editing_index = None
+        self.editing_id = None
 
     def grid_reset(self):
         self.entries.clear()
@@ -164,79 +221,58 @@ class FileCopyMasterPage:
         self.reset_fields()
 
     def schedule_task(self):
-        # Read all rows except the currently-edited task group
+        # Replace the rows of the currently-edited task group in the catalog
         current_task = self.task_name.get().strip()
-        new_entries = self.entries.copy()
-        other_entries = []
-        if os.path.exists(GRID_CSV):
-            with open(GRID_CSV, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    backup_type = row.get("BackupType", "Normal")
-                    selected = row.get("selected", "False").lower() in ("true", "1", "yes")
-                    if row["task_name"] != current_task:
-                        other_entries.append((
-                            row["task_name"],
-                            row["source"],
-                            row["backup"],
-                            backup_type,
-                            selected
-                        ))
-        # Combine other_entries and new_entries (new_entries overwrites all same task_name)
-        all_entries = other_entries + new_entries
-        with open(GRID_CSV, "w", newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["task_name", "source", "backup", "selected", "BackupType"])
-            for task, src, dst, backup_type, selected in all_entries:
-                writer.writerow([task, src, dst, str(selected), backup_type])
-        self.load_task_list_from_csv()
-        messagebox.showinfo("Task", "Paths and task names saved to CSV.\nTask list refreshed on right.")
+        catalog.save_task_entries(current_task, [
+            {"task_name": task, "source": src, "backup": dst, "selected": str(selected), "BackupType": backup_type}
+            for task, src, dst, backup_type, selected in self.entries.values()])
+        self.load_task_list()
+        messagebox.showinfo("Task", "Paths and task names saved to catalog.\nTask list refreshed on right.")
         self.entries.clear()
         self.refresh_tree()
         self.reset_fields()
 
-    def load_grid_from_csv(self):
-        self.entries.clear()
-        if not os.path.exists(GRID_CSV):
-            return
-        with open(GRID_CSV, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            all_entries = []
-            for row in reader:
-                backup_type = row.get("BackupType", "Normal")
-                selected = row.get("selected", "False").lower() in ("true", "1", "yes")
-                all_entries.append((
-                    row["task_name"],
-                    row["source"],
-                    row["backup"],
-                    backup_type,
-                    selected
-                ))
-        if not all_entries:
-            return
-        first_task = all_entries[0][0]
-        self.entries = [entry for entry in all_entries if entry[0] == first_task]
-        self.refresh_tree()
-        if self.entries:
-            self.task_name.set(self.entries[0][0])
-            self.source_path.set(self.entries[0][1])
-            self.dest_path.set(self.entries[0][2])
-            self.backup_type.set(self.entries[0][3])
-            self.editing_index = 0
+    def task_entry(self, row):
+        return (row["task_name"], row["source"], row["backup"], row.get("BackupType") or "Normal",
+                row.get("selected", "False").lower() in ("true", "1", "yes"))
+
+    def load_grid(self):
+        task_names = catalog.get_task_names()
+        if task_names:
+            self.show_task(task_names[0])
+        else:
+            self.set_entries([])
 
-    def load_task_list_from_csv(self):
+    def show_task(self, task_name):
+        self.set_entries(self.load_entries(task_name))
+        if self.entries:
+            row_id, (task, src, dst, backup_type, selected) = next(iter(self.entries.items()))
+            self.task_name.set(task)
+            self.source_path.set(src)
+            self.dest_path.set(dst)
+            self.backup_type.set(backup_type)
+            self.editing_id = row_id
+
+    def load_task_list(self):
+        # Lower-cased names are the filter index; typing rescans them, never the catalog
+        self.all_tasks = catalog.get_task_names()
+        self.task_keys = [name.lower() for name in self.all_tasks]
+        self.apply_filter()
+
+    def schedule_filter(self, *args):
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(FILTER_DELAY_MS, self.apply_filter)
+
+    def apply_filter(self):
+        self.filter_job = None
+        needle = self.task_filter.get().strip().lower()
+        tasks = self.all_tasks
+        if needle:
+            tasks = [name for name, key in zip(self.all_tasks, self.task_keys) if needle in key]
         self.task_list.delete(0, tk.END)
-        tasks = set()
-        if os.path.exists(GRID_CSV):
-            with open(GRID_CSV, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if "task_name" in row and row["task_name"]:
-                        tasks.add(row["task_name"])
-        sorted_tasks = sorted(tasks)
-        for task in sorted_tasks:
-            self.task_list.insert(tk.END, task)
-        if sorted_tasks:
+        if tasks:
+            self.task_list.insert(tk.END, *tasks)
             self.task_list.selection_set(0)
             self.task_list.activate(0)
 
@@ -244,47 +280,27 @@ class FileCopyMasterPage:
         selection = event.widget.curselection()
         if not selection:
             return
-        selected_task = event.widget.get(selection[0])
+        self.show_task(event.widget.get(selection[0]))
 
-        self.entries.clear()
-        self.refresh_tree()
-        for idx, (task, src, dst, backup_type, selected) in enumerate(self.load_entries_from_csv(selected_task)):
-            self.entries.append((task, src, dst, backup_type, selected))
-            if idx == 0:
-                self.task_name.set(task)
-                self.source_path.set(src)
-                self.dest_path.set(dst)
-                self.backup_type.set(backup_type)
-                self.editing_index = 0
-        self.refresh_tree()
+    def load_entries(self, task_name):
+        return [self.task_entry(row) for row in catalog.get_tasks([task_name])]
 
-    def load_entries_from_csv(self, task_name):
-        entries = []
-        if os.path.exists(GRID_CSV):
-            with open(GRID_CSV, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    backup_type = row.get("BackupType", "Normal")
-                    selected = row.get("selected", "False").lower() in ("true", "1", "yes")
-                    if row["task_name"] == task_name:
-                        entries.append((row["task_name"], row["source"], row["backup"], backup_type, selected))
-        return entries
-    
     def open_scheduler(self):
-        # Get distinct list of tasks from CSV
-        tasks = set()
-        if os.path.exists(GRID_CSV):
-            with open(GRID_CSV, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if "task_name" in row and row["task_name"]:
-                        tasks.add(row["task_name"])
-        child = TaskScheduleForm(self.root, sorted(tasks))
+        child = TaskScheduleForm(self.root, catalog.get_task_names())
         child.transient(self.root)  # Makes window stay on top
         child.grab_set()            # Modal - blocks events to other windows
         self.root.wait_window(child) # Wait here until window is destroyed
 
 
+    def run_now(self):
+        selection = self.task_list.curselection()
+        selected_task = self.task_list.get(selection[0]) if selection else self.task_name.get().strip()
+        tasks = catalog.get_tasks([selected_task]) if selected_task else []
+        if not tasks:
+            messagebox.showwarning("Run Now", "Select a saved task to run.")
+            return
+        RunWindow(self.root, f"Running {selected_task}", ["--task", selected_task], tasks)
+
     def remove_selected_task(self):
         selection = self.task_list.curselection()
         if not selection:
@@ -295,26 +311,11 @@ class FileCopyMasterPage:
         if not confirm:
             return
 
-        # Read all tasks except those matching selected_task:
-        remaining_entries = []
-        if os.path.exists(GRID_CSV):
-            with open(GRID_CSV, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if row.get("task_name") != selected_task:
-                        remaining_entries.append(row)
-
-        # Write back to CSV without the removed task
-        with open(GRID_CSV, "w", newline='') as csvfile:
-            fieldnames = ["task_name", "source", "backup", "selected", "BackupType"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(remaining_entries)
+        catalog.delete_task(selected_task)
 
         # Refresh UI
-        self.load_task_list_from_csv()
-        self.load_grid_from_csv()
-        self.refresh_tree()
+        self.load_task_list()
+        self.load_grid()
         self.reset_fields()
         messagebox.showinfo("Remove Selected", f"Deleted task '{selected_task}' successfully.")
 
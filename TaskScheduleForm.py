@@ -2,15 +2,13 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
 import getpass
-import csv
 import os
 import subprocess
-
-# SCHEDULE_CSV = "schedules.csv"
-
-
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-SCHEDULE_CSV = os.path.join(SCRIPT_DIR, 'schedules.csv')
+import catalog
+import scheduler
+from throttle import parse_profiles, parse_size
+from snapshots import retention_policy, RETENTION_FIELDS
+from gui_runner import RunWindow
 
 
 TASK_XML_TEMPLATE = '''<?xml version="1.0" encoding="UTF-16"?>
@@ -52,7 +50,7 @@ TASK_XML_TEMPLATE = '''<?xml version="1.0" encoding="UTF-16"?>
   <Actions Context="Author">
     <Exec>
       <Command>{python_path}</Command>
-      <Arguments>"{script_path}" "{tasks}"</Arguments>
+      <Arguments>"{script_path}" "{schedule}"</Arguments>
       <WorkingDirectory>{start_in}</WorkingDirectory>
     </Exec>
   </Actions>
@@ -67,14 +65,14 @@ def xml_escape(s):
              .replace("'", "&apos;"))
 
 
-def create_task_xml(task_name, python_path, script_path, start_in, start_dt, tasks):
+def create_task_xml(task_name, python_path, script_path, start_in, start_dt):
     xml = TASK_XML_TEMPLATE.format(
         dt=datetime.now().isoformat(),
         author=getpass.getuser(),
         start_dt=start_dt,  # ISO format "2025-11-01T18:00:00"
         python_path=xml_escape(python_path),
         script_path=xml_escape(script_path),
-        tasks=xml_escape(tasks),
+        schedule=xml_escape(task_name),
         start_in=xml_escape(start_in)
     )
     filename = f"{task_name}_schedule.xml"
@@ -88,13 +86,12 @@ def update_system_schedule(schedule_info):
     python_path = os.path.normpath(schedule_info["Python Path"])
     script_path = os.path.normpath(schedule_info["Script Path"])
     start_in = os.path.normpath(schedule_info["Start In"])
-    selected_tasks = schedule_info["Selected Tasks"]
     try:
         start_dt = datetime.strptime(schedule_info["Start DateTime"], "%m/%d/%Y %H:%M").strftime("%Y-%m-%dT%H:%M:00")
     except Exception:
         start_dt = datetime.now().strftime("%Y-%m-%dT%H:%M:00")
     if enabled:
-        xml_file = create_task_xml(task_name, python_path, script_path, start_in, start_dt, selected_tasks)
+        xml_file = create_task_xml(task_name, python_path, script_path, start_in, start_dt)
         cmd = ["schtasks", "/Create", "/TN", task_name, "/XML", xml_file, "/F"]
         try:
             subprocess.run(cmd, check=True)
@@ -113,7 +110,7 @@ class TaskScheduleForm(tk.Toplevel):
     def __init__(self, master, tasks):
         super().__init__(master)
         self.title("Task Schedule")
-        self.geometry("800x380")
+        self.geometry("800x515")
         self.tasks = tasks
         self.schedule_name = tk.StringVar()
         self.enabled = tk.StringVar(value="Yes")
@@ -122,6 +119,13 @@ class TaskScheduleForm(tk.Toplevel):
         self.python_path = tk.StringVar(value=r"C:\Users\manojkumar.pilane\AppData\Local\Programs\Python\Python310\python.exe")
         self.script_path = tk.StringVar(value=r"C:\Bakp.py")
         self.start_in = tk.StringVar(value=r"C:\Users\manojkumar.pilane\Documents\Python\GIT\UtilityPrograms\BackupTask")
+        self.max_parallel = tk.StringVar(value="1")
+        self.max_per_volume = tk.StringVar(value="1")
+        self.max_bytes = tk.StringVar()
+        self.max_files = tk.StringVar()
+        self.throttle_profiles = tk.StringVar()
+        self.io_priority = tk.StringVar(value="normal")
+        self.retention = {field: tk.StringVar() for field in RETENTION_FIELDS}
         self.selected_tasks = []
         self.all_schedules = []
 
@@ -155,18 +159,43 @@ class TaskScheduleForm(tk.Toplevel):
         startin_entry.grid(row=6, column=1, sticky='w')
         tk.Button(left, text="Browse", command=self.browse_startin).grid(row=6, column=2, sticky='w')
 
-        tk.Label(left, text="Select Tasks").grid(row=7, column=0, sticky='nw')
+        tk.Label(left, text='Max Parallel / Per Volume').grid(row=7, column=0, sticky='w')
+        parallel_frame = tk.Frame(left)
+        parallel_frame.grid(row=7, column=1, sticky='w')
+        tk.Entry(parallel_frame, textvariable=self.max_parallel, width=6).pack(side=tk.LEFT)
+        tk.Entry(parallel_frame, textvariable=self.max_per_volume, width=6).pack(side=tk.LEFT, padx=4)
+
+        tk.Label(left, text='Max Bytes/s / Files/s').grid(row=8, column=0, sticky='w')
+        throttle_frame = tk.Frame(left)
+        throttle_frame.grid(row=8, column=1, sticky='w')
+        tk.Entry(throttle_frame, textvariable=self.max_bytes, width=10).pack(side=tk.LEFT)
+        tk.Entry(throttle_frame, textvariable=self.max_files, width=6).pack(side=tk.LEFT, padx=4)
+
+        tk.Label(left, text='Throttle Profiles').grid(row=9, column=0, sticky='w')
+        tk.Entry(left, textvariable=self.throttle_profiles, width=37).grid(row=9, column=1, sticky='w')
+
+        tk.Label(left, text='IO Priority').grid(row=10, column=0, sticky='w')
+        ttk.Combobox(left, textvariable=self.io_priority, values=["normal", "low", "idle"], state="readonly", width=12).grid(row=10, column=1, sticky='w')
+
+        tk.Label(left, text='Keep Last/Hourly/Daily/Weekly').grid(row=11, column=0, sticky='w')
+        retention_frame = tk.Frame(left)
+        retention_frame.grid(row=11, column=1, sticky='w')
+        for field in RETENTION_FIELDS:
+            tk.Entry(retention_frame, textvariable=self.retention[field], width=6).pack(side=tk.LEFT, padx=(0, 4))
+
+        tk.Label(left, text="Select Tasks").grid(row=12, column=0, sticky='nw')
         self.tasks_listbox = tk.Listbox(left, selectmode=tk.MULTIPLE, width=28, height=6)
-        self.tasks_listbox.grid(row=7, column=1, sticky='w', pady=4)
+        self.tasks_listbox.grid(row=12, column=1, sticky='w', pady=4)
         for t in self.tasks:
             self.tasks_listbox.insert(tk.END, t)
 
         btn_frame = tk.Frame(left)
-        btn_frame.grid(row=8, column=1, sticky='ew', pady=12)
+        btn_frame.grid(row=13, column=1, sticky='ew', pady=12)
 
         tk.Button(btn_frame, text="Save Schedule", command=self.save_schedule, width=15).pack(side=tk.LEFT, padx=4)
         tk.Button(btn_frame, text="Reset", command=self.reset_fields, width=10).pack(side=tk.LEFT, padx=2)
         tk.Button(btn_frame, text="Delete", command=self.delete_selected_schedule, width=10).pack(side=tk.LEFT, padx=2)
+        tk.Button(btn_frame, text="Run Now", command=self.run_now, width=10).pack(side=tk.LEFT, padx=2)
 
 
         right = tk.Frame(self, bg="#fbf3f3", width=200)
@@ -207,26 +236,33 @@ class TaskScheduleForm(tk.Toplevel):
             "Script Path": self.script_path.get(),
             "Start In": self.start_in.get(),
             "Selected Tasks": selected_str,
+            "Max Parallel": self.max_parallel.get(),
+            "Max Per Volume": self.max_per_volume.get(),
+            "Max Bytes Per Sec": self.max_bytes.get().strip(),
+            "Max Files Per Sec": self.max_files.get().strip(),
+            "Throttle Profiles": self.throttle_profiles.get().strip(),
+            "IO Priority": self.io_priority.get(),
         }
+        data.update({field: var.get().strip() for field, var in self.retention.items()})
+        try:
+            parse_size(data["Max Bytes Per Sec"])
+            parse_size(data["Max Files Per Sec"])
+        except ValueError as e:
+            messagebox.showerror("Max Bytes/s / Files/s", str(e))
+            return
+        try:
+            parse_profiles(data["Throttle Profiles"])
+        except ValueError as e:
+            messagebox.showerror("Throttle Profiles", str(e))
+            return
+        try:
+            retention_policy(data)
+        except ValueError as e:
+            messagebox.showerror("Retention", str(e))
+            return
 
-        schedules = []
-        updated = False
-        if os.path.exists(SCHEDULE_CSV):
-            with open(SCHEDULE_CSV, newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row["Schedule Name"] == data["Schedule Name"]:
-                        schedules.append(data)
-                        updated = True
-                    else:
-                        schedules.append(row)
-        if not updated:
-            schedules.append(data)
-
-        with open(SCHEDULE_CSV, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=data.keys())
-            writer.writeheader()
-            writer.writerows(schedules)
+        catalog.save_schedule(data)
+        scheduler.notify_reload()
 
         update_system_schedule(data)
 
@@ -241,17 +277,21 @@ class TaskScheduleForm(tk.Toplevel):
         self.python_path.set(r"C:\Users\manojkumar.pilane\AppData\Local\Programs\Python\Python310\python.exe")
         self.script_path.set(r"C:\Bakp.py")
         self.start_in.set(r"C:\Users\manojkumar.pilane\Documents\Python\GIT\UtilityPrograms\BackupTask")
+        self.max_parallel.set("1")
+        self.max_per_volume.set("1")
+        self.max_bytes.set("")
+        self.max_files.set("")
+        self.throttle_profiles.set("")
+        self.io_priority.set("normal")
+        for var in self.retention.values():
+            var.set("")
         self.tasks_listbox.selection_clear(0, tk.END)
 
     def load_schedules_listbox(self):
         self.schedule_listbox.delete(0, tk.END)
-        self.all_schedules = []
-        if os.path.exists(SCHEDULE_CSV):
-            with open(SCHEDULE_CSV, newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                self.all_schedules = list(reader)
-            for sched in self.all_schedules:
-                self.schedule_listbox.insert(tk.END, sched["Schedule Name"])
+        self.all_schedules = catalog.get_schedules()
+        for sched in self.all_schedules:
+            self.schedule_listbox.insert(tk.END, sched["Schedule Name"])
 
     def load_selected_schedule(self, event):
         sel = self.schedule_listbox.curselection()
@@ -266,12 +306,29 @@ class TaskScheduleForm(tk.Toplevel):
         self.python_path.set(data.get("Python Path", r"C:\Users\manojkumar.pilane\AppData\Local\Programs\Python\Python310\python.exe"))
         self.script_path.set(data.get("Script Path", r"C:\Bakp.py"))
         self.start_in.set(data.get("Start In", r"C:\Users\manojkumar.pilane\Documents\Python\GIT\UtilityPrograms\BackupTask"))
+        self.max_parallel.set(data.get("Max Parallel") or "1")
+        self.max_per_volume.set(data.get("Max Per Volume") or "1")
+        self.max_bytes.set(data.get("Max Bytes Per Sec", ""))
+        self.max_files.set(data.get("Max Files Per Sec", ""))
+        self.throttle_profiles.set(data.get("Throttle Profiles", ""))
+        self.io_priority.set(data.get("IO Priority") or "normal")
+        for field, var in self.retention.items():
+            var.set(data.get(field, ""))
         self.tasks_listbox.selection_clear(0, tk.END)
         selected_tasks = data.get("Selected Tasks", "").split(",")
         for i, t in enumerate(self.tasks):
             if t in selected_tasks:
                 self.tasks_listbox.select_set(i)
 
+    def run_now(self):
+        name = self.schedule_name.get().strip()
+        schedule = catalog.get_schedule(name) if name else None
+        if schedule is None:
+            messagebox.showwarning("Run Now", "Save or select a schedule to run.")
+            return
+        task_names = [t.strip() for t in schedule.get("Selected Tasks", "").split(",") if t.strip()]
+        RunWindow(self, f"Running {name}", ["--now", name], catalog.get_tasks(task_names))
+
     def delete_selected_schedule(self):
         sel = self.schedule_listbox.curselection()
         if not sel:
@@ -283,32 +340,15 @@ class TaskScheduleForm(tk.Toplevel):
         if not confirm:
             return
 
-        # Remove from internal schedules list
-        schedules = []
-        deleted_schedule_info = None
-        if os.path.exists(SCHEDULE_CSV):
-            with open(SCHEDULE_CSV, newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row["Schedule Name"] != name_to_delete:
-                        schedules.append(row)
-                    else:
-                        deleted_schedule_info = row
+        # Remove from the catalog
+        deleted_schedule_info = catalog.delete_schedule(name_to_delete)
+        scheduler.notify_reload()
 
         # Remove system (Windows) scheduled task using schtasks
         if deleted_schedule_info:
             deleted_schedule_info["Enabled"] = "No"  # Set to trigger deletion
             update_system_schedule(deleted_schedule_info)
 
-        # Save back to CSV
-        if schedules:
-            fieldnames = schedules[0].keys()
-        else:
-            fieldnames = ["Schedule Name", "Enabled", "Start DateTime", "Frequency", "Python Path", "Script Path", "Start In", "Selected Tasks"]
-        with open(SCHEDULE_CSV, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(schedules)
         self.load_schedules_listbox()
         self.reset_fields()
         messagebox.showinfo("Delete", f"Schedule '{name_to_delete}' deleted.")
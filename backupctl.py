@@ -0,0 +1,71 @@
+import sys
+
+# Headless entry point: python -m backupctl <run|verify|list|snapshots|watch|bench> ...
+# Nothing beyond sys is imported until a subcommand runs, and nothing here needs
+# the GUI modules, so scheduled runs stay cheap to start.
+
+
+def verify_tasks(task_names):
+    import BackupProcess
+    import catalog
+    from logger import flush_logs
+    from snapshots import latest_snapshot, SNAPSHOT_TYPES
+    from tree_walker import parse_patterns
+    failed = False
+    for t in catalog.get_tasks(task_names):
+        backup_type = (t.get("BackupType") or "normal").lower()
+        # Each run of a snapshot task backs up into its own folder under the destination
+        snapshot = BackupProcess.task_flag(t, "Snapshots") and backup_type in SNAPSHOT_TYPES
+        if snapshot:
+            snapshot = latest_snapshot(t["task_name"], t["backup"])
+        if snapshot is None:
+            status, msg = False, f"Verify failed: no finished snapshot of {t['task_name']} in '{t['backup']}'"
+        else:
+            if snapshot:
+                t = dict(t, backup=snapshot)
+            status, msg = BackupProcess.verify_backup(t, backup_type, None,
+                                                      BackupProcess.task_int(t, "VerifyWorkers", 0),
+                                                      parse_patterns(t.get("Include")), parse_patterns(t.get("Exclude")))
+        BackupProcess.log_execution(t["task_name"], t["source"], t["backup"], "verify",
+                                    "Success" if status else "Failed", msg)
+        print(f"{t['task_name']}: {msg}")
+        failed = failed or not status
+    flush_logs()
+    return 1 if failed else 0
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="backupctl", description="Run and inspect backups without the GUI")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("run", help="Run schedules or tasks; takes the options of BackupProcess.py", add_help=False)
+    verify_cmd = sub.add_parser("verify", help="Check the latest backup of tasks against their sources")
+    verify_cmd.add_argument("tasks", nargs="+")
+    sub.add_parser("list", help="List tasks, schedules or run history; takes the options of catalog.py", add_help=False)
+    sub.add_parser("snapshots", help="List or prune snapshots; takes the options of snapshots.py", add_help=False)
+    sub.add_parser("watch", help="Journal source changes for tasks with the Watch option")
+    sub.add_parser("bench", help="Run benchmarks; takes the options of benchmark.py", add_help=False)
+    argv = sys.argv[1:] if argv is None else argv
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command == "run":
+        import BackupProcess
+        BackupProcess.main(rest)
+    elif args.command == "verify":
+        if rest:
+            parser.error(f"unrecognized arguments: {' '.join(rest)}")
+        sys.exit(verify_tasks(args.tasks))
+    elif args.command == "list":
+        import catalog
+        catalog.main(rest)
+    elif args.command == "snapshots":
+        import snapshots
+        snapshots.main(rest)
+    elif args.command == "watch":
+        import change_watch
+        change_watch.main(rest)
+    else:
+        import benchmark
+        benchmark.main(rest)
+
+if __name__ == "__main__":
+    main()
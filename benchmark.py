@@ -0,0 +1,323 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import logger
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MB = 1024 * 1024
+
+# name -> (task row overrides, number of back-to-back runs measured as one case)
+MODES = {
+    "normal": ({"BackupType": "Normal"}, 1),
+    "normal-parallel": ({"BackupType": "Normal", "Workers": "8"}, 1),
+    "incremental": ({"BackupType": "Incremental"}, 1),
+    "incremental-warm": ({"BackupType": "Incremental"}, 2),
+    "zip": ({"BackupType": "Zip"}, 1),
+    "zip-parallel": ({"BackupType": "Zip", "Workers": str(os.cpu_count() or 2)}, 1),
+    "tar": ({"BackupType": "Tar"}, 1),
+    "tar-parallel": ({"BackupType": "Tar", "Workers": str(os.cpu_count() or 2)}, 1),
+    "differential": ({"BackupType": "Differential"}, 2),
+    "dedup": ({"BackupType": "Dedup"}, 2),
+    "mirror": ({"BackupType": "Mirror"}, 1),
+    "mirror-stale": ({"BackupType": "Mirror", "Trash": "trash"}, 1),
+}
+SHAPES = ("tiny", "huge", "deep", "text", "random")
+# Scheduled runs start a fresh interpreter each time; these must stay cheap to import
+STARTUP_MODULES = ("backupctl", "BackupProcess")
+STARTUP_BUDGET_MS = 100
+
+
+def random_words(rnd, count=500):
+    return ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randint(3, 9))).encode()
+            for _ in range(count)]
+
+def text_block(rnd, words, size):
+    return b" ".join(rnd.choice(words) for _ in range(size // 6 + 1))[:size]
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def generate_shape(root, shape, scale=1.0, seed=1):
+    # Same shape, scale and seed always produce byte-identical trees
+    rnd = random.Random(f"{shape}-{seed}")
+    words = random_words(rnd)
+    if shape == "tiny":
+        for i in range(int(5000 * scale)):
+            write_file(os.path.join(root, f"d{i % 50}", f"f{i}.txt"), text_block(rnd, words, rnd.randint(64, 4096)))
+    elif shape == "huge":
+        for i in range(2):
+            path = os.path.join(root, f"huge{i}.bin")
+            os.makedirs(root, exist_ok=True)
+            with open(path, "wb") as f:
+                for block in range(int(64 * scale)):
+                    f.write(rnd.randbytes(MB) if block % 2 else text_block(rnd, words, MB))
+    elif shape == "deep":
+        folder = root
+        for depth in range(int(40 * scale) or 1):
+            folder = os.path.join(folder, f"level{depth}")
+            for i in range(5):
+                write_file(os.path.join(folder, f"f{i}.txt"), text_block(rnd, words, rnd.randint(512, 16384)))
+    elif shape == "text":
+        for i in range(int(400 * scale)):
+            write_file(os.path.join(root, f"d{i % 10}", f"doc{i}.txt"), text_block(rnd, words, 64 * 1024))
+    elif shape == "random":
+        for i in range(int(100 * scale)):
+            write_file(os.path.join(root, f"d{i % 10}", f"blob{i}.bin"), rnd.randbytes(256 * 1024))
+    else:
+        raise ValueError(f"Unknown shape '{shape}'")
+
+def tree_size(root):
+    files = total = 0
+    for r, d, names in os.walk(root):
+        for name in names:
+            files += 1
+            total += os.path.getsize(os.path.join(r, name))
+    return files, total
+
+def read_proc_io():
+    # Linux only: syscall and byte counters of this process
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except OSError:
+        return None
+
+def peak_rss_kb():
+    # VmHWM resets on exec; ru_maxrss on Linux keeps the parent's peak from before the fork
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak = max(peak, peak_children)
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def seed_stale_mirror(src, dst):
+    # A destination left by an earlier state of the source: a third of the files were
+    # renamed since, a third changed, and each folder holds a file deleted from the source,
+    # so the run exercises rename detection, the trash and deletion
+    shutil.copytree(src, dst)
+    count = 0
+    for root, _, names in os.walk(dst):
+        for name in names:
+            path = os.path.join(root, name)
+            if count % 3 == 1:
+                os.replace(path, path + ".old")
+            elif count % 3 == 2:
+                with open(path, "ab") as f:
+                    f.write(b"stale")
+            count += 1
+        write_file(os.path.join(root, "deleted.tmp"), b"stale")
+
+# name -> setup of the destination before the measured runs
+SEEDS = {"mirror-stale": seed_stale_mirror}
+
+def run_case(mode, src, dst, work):
+    # Runs in a fresh interpreter so peak RSS and syscall counters belong to this case only
+    logger.set_log_file(os.path.join(work, "debug.txt"))
+    # Run history, metrics and the catalog (with its one-time CSV import) stay in work,
+    # away from the production files next to the scripts
+    import BackupProcess
+    import catalog
+    catalog.CATALOG_DB = os.path.join(work, "backup_catalog.db")
+    catalog.PATHS_CSV = os.path.join(work, "paths.csv")
+    catalog.SCHEDULE_CSV = os.path.join(work, "schedules.csv")
+    catalog.LOG_CSV = BackupProcess.LOG_CSV = os.path.join(work, "backup_log.csv")
+    BackupProcess.METRICS_FILE = os.path.join(work, "backup_metrics.prom")
+    overrides, runs = MODES[mode]
+    task = {"task_name": f"bench-{mode}", "source": src, "backup": dst, **overrides}
+    if mode in SEEDS:
+        SEEDS[mode](src, dst)
+    io_before = read_proc_io()
+    start = time.perf_counter()
+    timings = []
+    for _ in range(runs):
+        run_start = time.perf_counter()
+        if not BackupProcess.run_task(task):
+            raise RuntimeError(f"{mode} failed, see {work}")
+        timings.append(time.perf_counter() - run_start)
+    elapsed = time.perf_counter() - start
+    io_after = read_proc_io()
+    result = {"seconds": round(elapsed, 4), "run_seconds": [round(t, 4) for t in timings],
+              "peak_rss_kb": peak_rss_kb()}
+    if io_before and io_after:
+        for key in ("syscr", "syscw", "read_bytes", "write_bytes"):
+            result[key] = io_after[key] - io_before[key]
+    return result
+
+def run_suite(shapes, modes, scale, work):
+    results = []
+    for shape in shapes:
+        src = os.path.join(work, "src", shape)
+        generate_shape(src, shape, scale)
+        files, total = tree_size(src)
+        for mode in modes:
+            dst = os.path.join(work, "dst", shape, mode)
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "case", mode, src, dst, work],
+                                 capture_output=True, text=True)
+            if out.returncode != 0:
+                raise RuntimeError(f"{shape}/{mode} failed:\n{out.stderr}")
+            case = json.loads(out.stdout.strip().splitlines()[-1])
+            first_run = case["run_seconds"][0] or 1e-9
+            case.update(shape=shape, mode=mode, files=files, bytes=total,
+                        mb_per_s=round(total / MB / first_run, 2), files_per_s=round(files / first_run, 1))
+            results.append(case)
+            print(f"{shape:<7} {mode:<17} {case['seconds']:8.2f} s  {case['mb_per_s']:8.1f} MB/s  "
+                  f"{case['files_per_s']:9.1f} files/s  rss {case['peak_rss_kb']} KB", file=sys.stderr)
+            shutil.rmtree(dst, ignore_errors=True)
+        shutil.rmtree(src, ignore_errors=True)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["shape"], r["mode"]): r for r in json.load(f)["results"]}
+    for r in results:
+        old = baseline.get((r["shape"], r["mode"]))
+        if old:
+            change = (r["seconds"] - old["seconds"]) / max(old["seconds"], 1e-9) * 100
+            print(f"{r['shape']:<7} {r['mode']:<17} {old['seconds']:8.2f} s -> {r['seconds']:8.2f} s  ({change:+.1f}%)",
+                  file=sys.stderr)
+
+def measure_startup(module, runs):
+    # Median wall time of a fresh interpreter importing module (None: the bare interpreter),
+    # and the median import time of the module itself as reported by -X importtime
+    walls, imports = [], []
+    code = f"import {module}" if module else "pass"
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=SCRIPT_DIR, check=True)
+        walls.append((time.perf_counter() - start) * 1000)
+        if module:
+            out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=SCRIPT_DIR,
+                                 capture_output=True, text=True, check=True)
+            for line in out.stderr.splitlines():
+                if line.rstrip().endswith(f"| {module}"):
+                    imports.append(int(line.split("|")[1]) / 1000)
+    walls.sort()
+    imports.sort()
+    return walls[len(walls) // 2], imports[len(imports) // 2] if imports else 0.0
+
+def bench_zip(src, out_root, workers):
+    import BackupProcess
+    results = {}
+    for label, count in (("serial", 1), (f"parallel x{workers}", workers)):
+        dst = os.path.join(out_root, label.replace(" ", "_"))
+        start = time.perf_counter()
+        status, msg = BackupProcess.zip_folder(src, dst, count)
+        elapsed = time.perf_counter() - start
+        if not status:
+            raise RuntimeError(msg)
+        zip_path = os.path.join(dst, os.path.basename(src) + ".zip")
+        with zipfile.ZipFile(zip_path) as zipf:
+            if zipf.testzip() is not None:
+                raise RuntimeError(f"{label}: corrupt member in {zip_path}")
+            members = sorted((i.filename, i.CRC) for i in zipf.infolist())
+        results[label] = (elapsed, os.path.getsize(zip_path), members)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the backup engine on synthetic trees")
+    sub = parser.add_subparsers(dest="command", required=True)
+    suite = sub.add_parser("suite", help="Run every mode on every tree shape and report JSON")
+    suite.add_argument("--shapes", default=",".join(SHAPES))
+    suite.add_argument("--modes", default=",".join(MODES))
+    suite.add_argument("--scale", type=float, default=1.0)
+    suite.add_argument("--output", help="Write the JSON report here instead of stdout")
+    suite.add_argument("--compare", help="Earlier JSON report to compare against")
+    zip_cmd = sub.add_parser("zip", help="Compare serial and parallel zip_folder on a mixed tree")
+    zip_cmd.add_argument("--scale", type=float, default=1.0)
+    zip_cmd.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    case = sub.add_parser("case")
+    case.add_argument("mode", choices=list(MODES))
+    case.add_argument("src")
+    case.add_argument("dst")
+    case.add_argument("work")
+    startup = sub.add_parser("startup", help="Time a fresh interpreter importing the headless entry points")
+    startup.add_argument("--runs", type=int, default=10)
+    startup.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS,
+                         help="Exit with status 1 if a startup median is over this")
+    args = parser.parse_args(argv)
+
+    if args.command == "case":
+        print(json.dumps(run_case(args.mode, args.src, args.dst, args.work)))
+        return
+    if args.command == "startup":
+        over = False
+        base_wall, _ = measure_startup(None, args.runs)
+        print(f"{'interpreter':<14} {base_wall:7.1f} ms")
+        for module in STARTUP_MODULES:
+            wall, imported = measure_startup(module, args.runs)
+            over = over or wall > args.budget_ms
+            print(f"{module:<14} {wall:7.1f} ms  (import {imported:.1f} ms)")
+        if over:
+            print(f"Over the {args.budget_ms:.0f} ms budget", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    work = tempfile.mkdtemp(prefix="backup-bench-")
+    try:
+        logger.set_log_file(os.path.join(work, "debug.txt"))
+        if args.command == "zip":
+            src = os.path.join(work, "source")
+            for shape in ("text", "random", "huge"):
+                generate_shape(os.path.join(src, shape), shape, args.scale)
+            files, total = tree_size(src)
+            results = bench_zip(src, os.path.join(work, "out"), args.workers)
+            same_layout = len({tuple(r[2]) for r in results.values()}) == 1
+            print(f"Source: {files} files, {total / MB:.1f} MB")
+            for label, (elapsed, size, _) in results.items():
+                print(f"{label:<14} {elapsed:8.2f} s  {total / MB / elapsed:8.1f} MB/s  archive {size / MB:.1f} MB")
+            print(f"Identical members and CRCs: {same_layout}")
+            return
+        shapes = [s for s in args.shapes.split(",") if s]
+        modes = [m for m in args.modes.split(",") if m]
+        for mode in modes:
+            if mode not in MODES:
+                parser.error(f"unknown mode '{mode}'")
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": args.scale,
+            "results": run_suite(shapes, modes, args.scale, work),
+        }
+        if args.compare:
+            compare(report["results"], args.compare)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
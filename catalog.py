@@ -0,0 +1,325 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CATALOG_DB = os.path.join(SCRIPT_DIR, 'backup_catalog.db')
+PATHS_CSV = os.path.join(SCRIPT_DIR, 'paths.csv')
+SCHEDULE_CSV = os.path.join(SCRIPT_DIR, 'schedules.csv')
+LOG_CSV = os.path.join(SCRIPT_DIR, 'backup_log.csv')
+
+TASK_FIELDS = ["task_name", "source", "backup", "selected", "BackupType"]
+SCHEDULE_FIELDS = ["Schedule Name", "Enabled", "Start DateTime", "Frequency", "Python Path",
+                   "Script Path", "Start In", "Selected Tasks"]
+SCHEDULE_COLUMNS = ["name", "enabled", "start_datetime", "frequency", "python_path",
+                    "script_path", "start_in", "selected_tasks"]
+RUN_FIELDS = ["DateTime", "TaskName", "Source", "Destination", "BackupType", "Status", "Message"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    task_name TEXT NOT NULL,
+    source TEXT NOT NULL,
+    backup TEXT NOT NULL,
+    selected INTEGER NOT NULL DEFAULT 0,
+    backup_type TEXT NOT NULL DEFAULT 'Normal',
+    options TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS tasks_by_name ON tasks (task_name);
+CREATE TABLE IF NOT EXISTS schedules (
+    name TEXT PRIMARY KEY,
+    enabled TEXT, start_datetime TEXT, frequency TEXT, python_path TEXT,
+    script_path TEXT, start_in TEXT, selected_tasks TEXT,
+    options TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    task_name TEXT NOT NULL,
+    source TEXT, destination TEXT, backup_type TEXT, status TEXT, message TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_task ON runs (task_name, started);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (started);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    task_name TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    path TEXT NOT NULL,
+    created TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_by_task ON snapshots (task_name, destination, created);
+CREATE TABLE IF NOT EXISTS watches (
+    source TEXT PRIMARY KEY,
+    since TEXT NOT NULL,
+    heartbeat TEXT NOT NULL,
+    valid INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY,
+    task_name TEXT NOT NULL,
+    source TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    UNIQUE (task_name, source, rel_path)
+);
+CREATE TABLE IF NOT EXISTS full_scans (
+    task_name TEXT NOT NULL,
+    source TEXT NOT NULL,
+    scanned TEXT NOT NULL,
+    PRIMARY KEY (task_name, source)
+);
+"""
+
+
+@contextmanager
+def connect(path=None):
+    # One short transaction per call; WAL lets the GUI read while a scheduled run writes
+    conn = sqlite3.connect(path or CATALOG_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        if conn.execute("SELECT value FROM meta WHERE key = 'csv_imported'").fetchone() is None:
+            # Take the write lock before importing and check again: the GUI and a scheduled run
+            # opening a fresh catalog together would otherwise both import the CSV files
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("SELECT value FROM meta WHERE key = 'csv_imported'").fetchone() is None:
+                    import_csv(conn)
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('csv_imported', '1')")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _read_csv(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='', encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def import_csv(conn):
+    # One-time migration of the CSV files the catalog replaces
+    for row in _read_csv(PATHS_CSV):
+        _insert_task(conn, row)
+    for row in _read_csv(SCHEDULE_CSV):
+        if row.get("Schedule Name"):
+            _upsert_schedule(conn, row)
+    conn.executemany(
+        "INSERT INTO runs (started, task_name, source, destination, backup_type, status, message) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [[row.get(f) or "" for f in RUN_FIELDS] for row in _read_csv(LOG_CSV)])
+
+def _is_selected(value):
+    return str(value).strip().lower() in ("true", "1", "yes")
+
+def _insert_task(conn, row):
+    options = {k: v for k, v in row.items() if k not in TASK_FIELDS and k and v not in (None, "")}
+    conn.execute(
+        "INSERT INTO tasks (task_name, source, backup, selected, backup_type, options) VALUES (?, ?, ?, ?, ?, ?)",
+        (row["task_name"], row["source"], row["backup"], int(_is_selected(row.get("selected", False))),
+         row.get("BackupType") or "Normal", json.dumps(options)))
+
+def _task_row(row):
+    task = {"task_name": row["task_name"], "source": row["source"], "backup": row["backup"],
+            "selected": str(bool(row["selected"])), "BackupType": row["backup_type"]}
+    task.update(json.loads(row["options"] or "{}"))
+    return task
+
+def get_tasks(task_names=None):
+    with connect() as conn:
+        if task_names is None:
+            rows = conn.execute("SELECT * FROM tasks ORDER BY id").fetchall()
+        else:
+            names = list(task_names)
+            rows = conn.execute(
+                f"SELECT * FROM tasks WHERE task_name IN ({','.join('?' * len(names))}) ORDER BY id",
+                names).fetchall()
+    return [_task_row(r) for r in rows]
+
+def get_task_names():
+    with connect() as conn:
+        return [r[0] for r in conn.execute("SELECT DISTINCT task_name FROM tasks WHERE task_name != '' ORDER BY task_name")]
+
+def save_task_entries(task_name, entries):
+    # Replaces every row of task_name with entries (dicts with TASK_FIELDS keys).
+    # Option columns the grid does not edit are carried over per source/destination.
+    with connect() as conn:
+        old = {(r["task_name"], r["source"], r["backup"]): json.loads(r["options"] or "{}")
+               for r in conn.execute("SELECT * FROM tasks WHERE task_name = ?", (task_name,))}
+        conn.execute("DELETE FROM tasks WHERE task_name = ?", (task_name,))
+        for entry in entries:
+            row = dict(old.get((entry["task_name"], entry["source"], entry["backup"]), {}))
+            row.update(entry)
+            _insert_task(conn, row)
+
+def delete_task(task_name):
+    with connect() as conn:
+        conn.execute("DELETE FROM tasks WHERE task_name = ?", (task_name,))
+
+def _schedule_row(row):
+    schedule = {field: row[column] or "" for field, column in zip(SCHEDULE_FIELDS, SCHEDULE_COLUMNS)}
+    schedule.update(json.loads(row["options"] or "{}"))
+    return schedule
+
+def _upsert_schedule(conn, data):
+    options = {k: v for k, v in data.items() if k not in SCHEDULE_FIELDS and k and v not in (None, "")}
+    conn.execute(
+        f"INSERT OR REPLACE INTO schedules ({', '.join(SCHEDULE_COLUMNS)}, options) "
+        f"VALUES ({', '.join('?' * (len(SCHEDULE_COLUMNS) + 1))})",
+        [data.get(f) or "" for f in SCHEDULE_FIELDS] + [json.dumps(options)])
+
+def get_schedules():
+    with connect() as conn:
+        return [_schedule_row(r) for r in conn.execute("SELECT * FROM schedules ORDER BY rowid")]
+
+def get_schedule(name):
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM schedules WHERE name = ?", (name,)).fetchone()
+    return _schedule_row(row) if row else None
+
+def save_schedule(data):
+    with connect() as conn:
+        _upsert_schedule(conn, data)
+
+def delete_schedule(name):
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM schedules WHERE name = ?", (name,)).fetchone()
+        conn.execute("DELETE FROM schedules WHERE name = ?", (name,))
+    return _schedule_row(row) if row else None
+
+def log_run(started, task_name, source, dest, backup_type, status, message):
+    with connect() as conn:
+        conn.execute(
+            "INSERT INTO runs (started, task_name, source, destination, backup_type, status, message) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (started, task_name, source, dest, backup_type, status, message))
+
+def get_runs(task_name=None, since=None, limit=100):
+    query = "SELECT * FROM runs WHERE 1 = 1"
+    args = []
+    if task_name:
+        query += " AND task_name = ?"
+        args.append(task_name)
+    if since:
+        query += " AND started >= ?"
+        args.append(since)
+    query += " ORDER BY started DESC, id DESC LIMIT ?"
+    args.append(limit)
+    with connect() as conn:
+        return [dict(r) for r in conn.execute(query, args)]
+
+def add_snapshot(task_name, destination, path, created, status="Running"):
+    with connect() as conn:
+        return conn.execute(
+            "INSERT INTO snapshots (task_name, destination, path, created, status) VALUES (?, ?, ?, ?, ?)",
+            (task_name, destination, path, created, status)).lastrowid
+
+def set_snapshot_status(snapshot_id, status):
+    with connect() as conn:
+        conn.execute("UPDATE snapshots SET status = ? WHERE id = ?", (status, snapshot_id))
+
+def get_snapshots(task_name=None, destination=None):
+    # Newest first
+    query = "SELECT * FROM snapshots WHERE 1 = 1"
+    args = []
+    if task_name:
+        query += " AND task_name = ?"
+        args.append(task_name)
+    if destination:
+        query += " AND destination = ?"
+        args.append(destination)
+    with connect() as conn:
+        return [dict(r) for r in conn.execute(query + " ORDER BY created DESC, id DESC", args)]
+
+def delete_snapshots(ids):
+    with connect() as conn:
+        conn.executemany("DELETE FROM snapshots WHERE id = ?", [(i,) for i in ids])
+
+def start_watch(source, since, valid=True):
+    with connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO watches (source, since, heartbeat, valid) VALUES (?, ?, ?, ?)",
+                     (source, since, since, int(valid)))
+
+def watch_heartbeat(sources, now):
+    with connect() as conn:
+        conn.executemany("UPDATE watches SET heartbeat = ? WHERE source = ?", [(now, s) for s in sources])
+
+def stop_watch(source):
+    with connect() as conn:
+        conn.execute("UPDATE watches SET valid = 0 WHERE source = ?", (source,))
+
+def get_watch(source):
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM watches WHERE source = ?", (source,)).fetchone()
+    return dict(row) if row else None
+
+def record_changes(source, task_names, rel_paths):
+    # A path changed again gets a new id, so a run that read the older id does not clear it
+    with connect() as conn:
+        conn.executemany("INSERT OR REPLACE INTO changes (task_name, source, rel_path) VALUES (?, ?, ?)",
+                         [(t, source, p) for t in task_names for p in rel_paths])
+
+def get_changes(task_name, source):
+    # (last change id, journaled paths, start of the last full scan or None)
+    with connect() as conn:
+        rows = conn.execute("SELECT id, rel_path FROM changes WHERE task_name = ? AND source = ?",
+                            (task_name, source)).fetchall()
+        scan = conn.execute("SELECT scanned FROM full_scans WHERE task_name = ? AND source = ?",
+                            (task_name, source)).fetchone()
+    return max((r["id"] for r in rows), default=0), [r["rel_path"] for r in rows], scan["scanned"] if scan else None
+
+def clear_changes(task_name, source, last_id, scanned=None):
+    with connect() as conn:
+        conn.execute("DELETE FROM changes WHERE task_name = ? AND source = ? AND id <= ?", (task_name, source, last_id))
+        if scanned:
+            conn.execute("INSERT OR REPLACE INTO full_scans (task_name, source, scanned) VALUES (?, ?, ?)",
+                         (task_name, source, scanned))
+
+def set_task_option(task_name, key, value):
+    # Per-task options (Hash, Workers, Compression, ...) have no grid column; set them here
+    with connect() as conn:
+        rows = conn.execute("SELECT id, options FROM tasks WHERE task_name = ?", (task_name,)).fetchall()
+        for row in rows:
+            options = json.loads(row["options"] or "{}")
+            if value:
+                options[key] = value
+            else:
+                options.pop(key, None)
+            conn.execute("UPDATE tasks SET options = ? WHERE id = ?", (json.dumps(options), row["id"]))
+    return len(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the backup catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("tasks", help="List task rows with their options")
+    sub.add_parser("schedules", help="List schedules")
+    runs_cmd = sub.add_parser("runs", help="Show run history, newest first")
+    runs_cmd.add_argument("--task")
+    runs_cmd.add_argument("--since", help='"YYYY-MM-DD HH:MM:SS"')
+    runs_cmd.add_argument("--limit", type=int, default=20)
+    set_cmd = sub.add_parser("set", help="Set (or clear, with an empty value) a per-task option")
+    set_cmd.add_argument("task")
+    set_cmd.add_argument("key")
+    set_cmd.add_argument("value")
+    args = parser.parse_args(argv)
+
+    if args.command == "tasks":
+        for t in get_tasks():
+            options = {k: v for k, v in t.items() if k not in TASK_FIELDS}
+            print(f"{t['task_name']}  {t['BackupType']:<12}  {t['source']} -> {t['backup']}  {options or ''}")
+    elif args.command == "schedules":
+        for s in get_schedules():
+            print(f"{s['Schedule Name']}  enabled={s['Enabled']}  {s['Start DateTime']}  {s['Frequency']}  tasks={s['Selected Tasks']}")
+    elif args.command == "runs":
+        for r in get_runs(args.task, args.since, args.limit):
+            print(f"{r['started']}  {r['task_name']}  {r['backup_type']}  {r['status']}  {r['message']}")
+    else:
+        print(f"Updated {set_task_option(args.task, args.key, args.value)} rows of {args.task}")
+
+if __name__ == "__main__":
+    main()
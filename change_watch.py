@@ -0,0 +1,329 @@
+import argparse
+import ctypes
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import catalog
+from logger import log_message, flush_logs
+from tree_walker import walk_tree, matches, WalkEntry
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+FLUSH_SECONDS = 1.0            # journaled paths are written to the catalog this often
+HEARTBEAT_SECONDS = 10
+STALE_HEARTBEATS = 3           # a watcher silent this many heartbeats is presumed dead
+FULL_SCAN_HOURS = 24           # default FullScanEvery: rescan the tree anyway after this long
+RELOAD_SECONDS = 60            # the standalone watcher re-reads its task list this often
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def now_text():
+    return datetime.now().strftime(TIME_FORMAT)
+
+def available():
+    return sys.platform.startswith("linux")
+
+def watch_sources(tasks):
+    # {source: [task names]} for incremental tasks with the Watch option
+    sources = {}
+    for t in tasks:
+        if str(t.get("Watch") or "").strip().lower() in ("true", "1", "yes") \
+                and (t.get("BackupType") or "").strip().lower() == "incremental":
+            names = sources.setdefault(os.path.abspath(t["source"]), [])
+            if t["task_name"] not in names:
+                names.append(t["task_name"])
+    return sources
+
+
+def read_journal(task_name, source, full_scan_hours=FULL_SCAN_HOURS, have_manifest=True):
+    # Returns (last change id, time this read started, journaled paths). The paths are None
+    # when the run must scan the whole tree: no watcher has covered the source since the last
+    # full scan, the watcher stopped or overflowed, or the periodic full scan is due.
+    started = now_text()
+    try:
+        last_id, paths, scanned = catalog.get_changes(task_name, os.path.abspath(source))
+        watch = catalog.get_watch(os.path.abspath(source))
+    except Exception as e:
+        log_message(f"Error reading change journal of {task_name}: {e}")
+        return None
+    if not have_manifest or scanned is None or watch is None or not watch["valid"]:
+        return last_id, started, None
+    now = datetime.now()
+    if watch["since"] > scanned \
+            or datetime.strptime(watch["heartbeat"], TIME_FORMAT) < now - timedelta(seconds=HEARTBEAT_SECONDS * STALE_HEARTBEATS) \
+            or datetime.strptime(scanned, TIME_FORMAT) < now - timedelta(hours=full_scan_hours):
+        return last_id, started, None
+    return last_id, started, paths
+
+def finish_journal(task_name, source, journal):
+    # After a successful run: drop the paths it processed, and remember a full scan
+    last_id, started, paths = journal
+    try:
+        catalog.clear_changes(task_name, os.path.abspath(source), last_id, started if paths is None else None)
+    except Exception as e:
+        log_message(f"Error updating change journal of {task_name}: {e}")
+
+def excluded(rel_path, exclude):
+    # An excluded folder hides everything below it, as in walk_tree
+    parts = rel_path.split("/")
+    return any(matches("/".join(parts[:i]), exclude) for i in range(1, len(parts) + 1))
+
+def journal_entries(src, paths, include=None, exclude=None):
+    # WalkEntry items for the journaled paths only; a journaled folder (created or moved
+    # in) is walked, since the files inside it raised no events of their own
+    made = set()
+    for rel_path in sorted(set(paths)):
+        parts = rel_path.split("/")
+        if any("/".join(parts[:i]) in made for i in range(1, len(parts))):
+            continue
+        if exclude and excluded(rel_path, exclude):
+            continue
+        path = os.path.join(src, *parts)
+        if not os.path.lexists(path):
+            continue
+        if os.path.isdir(path):
+            made.add(rel_path)
+            yield WalkEntry(path, rel_path, True, None)
+            for item in walk_tree(path, dirs=True):
+                sub_path = f"{rel_path}/{item.rel_path}"
+                if exclude and excluded(sub_path, exclude):
+                    continue
+                if not item.is_dir and include and not matches(sub_path, include):
+                    continue
+                yield WalkEntry(item.path, sub_path, item.is_dir, item.stat)
+            continue
+        if include and not matches(rel_path, include):
+            continue
+        parent = "/".join(parts[:-1])
+        if parent and parent not in made:
+            made.add(parent)
+            yield WalkEntry(os.path.dirname(path), parent, True, None)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        yield WalkEntry(path, rel_path, False, st)
+
+def drop_journaled(manifest, paths):
+    # Manifest entries for the journaled paths and everything below them; the run re-adds
+    # whatever still exists
+    changed = set(paths)
+    kept = {}
+    for rel_path, entry in manifest.items():
+        parts = rel_path.split("/")
+        if not any("/".join(parts[:i]) in changed for i in range(1, len(parts) + 1)):
+            kept[rel_path] = entry
+    return kept
+
+
+class ChangeWatcher:
+    # Records changed paths of watched sources into the catalog using Linux inotify, one
+    # watch per folder. Sources are swapped in with set_sources(); the event loop applies
+    # them, so all inotify calls stay on one thread.
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.sources = {}
+        self.wanted = None
+        self.wanted_lock = threading.Lock()
+        self.wds = {}
+        self.watched = {}
+        self.pending = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def set_sources(self, sources):
+        with self.wanted_lock:
+            self.wanted = dict(sources)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def add_tree(self, source, rel_dir):
+        top = os.path.join(source, *rel_dir.split("/")) if rel_dir else source
+        folders = [(top, rel_dir)]
+        folders += [(item.path, f"{rel_dir}/{item.rel_path}" if rel_dir else item.rel_path)
+                    for item in walk_tree(top, dirs=True) if item.is_dir]
+        for path, rel_path in folders:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd >= 0:
+                self.wds[wd] = (source, rel_path)
+                self.watched[(source, rel_path)] = wd
+                continue
+            code = ctypes.get_errno()
+            if code == errno.ENOSPC:
+                raise OSError(code, "inotify watch limit reached (fs.inotify.max_user_watches)")
+            if code not in (errno.ENOENT, errno.ENOTDIR):
+                raise OSError(code, f"Cannot watch '{path}'")
+
+    def remove_tree(self, source, rel_dir=None):
+        for wd, (wd_source, rel_path) in list(self.wds.items()):
+            if wd_source == source and (rel_dir is None or rel_path == rel_dir or rel_path.startswith(rel_dir + "/")):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.wds[wd]
+                self.watched.pop((wd_source, rel_path), None)
+
+    def apply_sources(self):
+        with self.wanted_lock:
+            wanted, self.wanted = self.wanted, None
+        if wanted is None:
+            return
+        for source in [s for s in self.sources if s not in wanted]:
+            self.flush()
+            self.remove_tree(source)
+            catalog.stop_watch(source)
+            del self.sources[source]
+        for source, task_names in wanted.items():
+            if source in self.sources:
+                self.sources[source] = task_names
+                continue
+            try:
+                self.add_tree(source, "")
+            except OSError as e:
+                log_message(f"Not watching '{source}': {e}")
+                self.remove_tree(source)
+                catalog.stop_watch(source)
+                continue
+            self.sources[source] = task_names
+            # Coverage starts once every folder has its watch; the next run scans fully
+            catalog.start_watch(source, now_text())
+            log_message(f"Watching '{source}' for {', '.join(task_names)}")
+
+    def restart_source(self, source, reason):
+        # Events were lost: restart coverage so the next run falls back to a full scan
+        log_message(f"Change journal of '{source}' reset: {reason}")
+        catalog.start_watch(source, now_text())
+
+    def handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            for source in self.sources:
+                self.restart_source(source, "event queue overflow")
+            return
+        if mask & IN_IGNORED:
+            if wd in self.wds:
+                self.watched.pop(self.wds.pop(wd), None)
+            return
+        if wd not in self.wds:
+            return
+        source, rel_dir = self.wds[wd]
+        if source not in self.sources:
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if not rel_dir:
+                self.restart_source(source, "source folder removed or moved")
+            return
+        if not name:
+            return
+        rel_path = f"{rel_dir}/{name}" if rel_dir else name
+        self.pending.setdefault(source, set()).add(rel_path)
+        # Symlinked folders are backed up like real ones (walk_tree follows them), so
+        # they are watched too; inotify reports them without IN_ISDIR
+        if mask & (IN_MOVED_FROM | IN_DELETE) and (source, rel_path) in self.watched:
+            self.remove_tree(source, rel_path)
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            if mask & IN_ISDIR or os.path.isdir(os.path.join(source, *rel_path.split("/"))):
+                try:
+                    self.add_tree(source, rel_path)
+                except OSError as e:
+                    self.restart_source(source, str(e))
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            self.handle(wd, mask, os.fsdecode(name))
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        for source, rel_paths in pending.items():
+            if source in self.sources:
+                catalog.record_changes(source, self.sources[source], sorted(rel_paths))
+
+    def run(self):
+        last_flush = last_heartbeat = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                self.apply_sources()
+                ready, _, _ = select.select([self.fd], [], [], FLUSH_SECONDS)
+                if ready:
+                    self.read_events()
+                now = time.monotonic()
+                if now - last_flush >= FLUSH_SECONDS:
+                    self.flush()
+                    last_flush = now
+                if now - last_heartbeat >= HEARTBEAT_SECONDS:
+                    catalog.watch_heartbeat(list(self.sources), now_text())
+                    last_heartbeat = now
+        except Exception as e:
+            log_message(f"Change watcher stopped: {e}")
+        finally:
+            self.stop_event.set()
+            try:
+                self.flush()
+                for source in self.sources:
+                    catalog.stop_watch(source)
+            finally:
+                os.close(self.fd)
+
+def start_watcher(sources):
+    # Runs a watcher on a daemon thread; None where inotify is unavailable
+    if not available():
+        log_message("Change journal needs inotify (Linux); Watch tasks will use full scans")
+        return None
+    watcher = ChangeWatcher()
+    watcher.set_sources(sources)
+    watcher.thread = threading.Thread(target=watcher.run, name="change-watcher", daemon=True)
+    watcher.thread.start()
+    return watcher
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Journal source changes for tasks with the Watch option")
+    parser.parse_args(argv)
+    watcher = start_watcher(watch_sources(catalog.get_tasks()))
+    if watcher is None:
+        sys.exit(1)
+    try:
+        while not watcher.stop_event.wait(RELOAD_SECONDS):
+            watcher.set_sources(watch_sources(catalog.get_tasks()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        watcher.thread.join()
+        flush_logs()
+
+if __name__ == "__main__":
+    main()
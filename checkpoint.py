@@ -0,0 +1,75 @@
+import json
+import os
+import time
+
+from manifest import meta_path, safe_name
+
+CHECKPOINT_SECONDS = 30
+CHECKPOINT_RECORDS = 1000
+ZIPINFO_FIELDS = ("filename", "date_time", "compress_type", "external_attr", "CRC",
+                  "compress_size", "file_size", "header_offset", "flag_bits", "create_system")
+
+
+def journal_path(dst, task_name):
+    return meta_path(dst, f"{safe_name(task_name)}.journal")
+
+class Journal:
+    # Append-only JSON-lines file; records become durable at the next checkpoint
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A line torn by the interruption ends the usable journal
+                    break
+        return records
+
+    def add(self, record):
+        self.pending.append(record)
+
+    def due(self):
+        return (len(self.pending) >= CHECKPOINT_RECORDS
+                or time.monotonic() - self.last_flush >= CHECKPOINT_SECONDS)
+
+    def flush(self):
+        if self.pending:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r) + "\n" for r in self.pending))
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending = []
+        self.last_flush = time.monotonic()
+
+    def clear(self):
+        self.pending = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def zipinfo_record(zinfo):
+    return {field: getattr(zinfo, field) for field in ZIPINFO_FIELDS}
+
+def zip_resume_state(records):
+    # Members count only up to the last offset record: anything after it may be torn
+    members, confirmed, offset = [], [], 0
+    for record in records:
+        if "member" in record:
+            members.append(record["member"])
+        elif "offset" in record:
+            confirmed.extend(members)
+            members = []
+            offset = record["offset"]
+    return confirmed, offset
@@ -0,0 +1,175 @@
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from manifest import HASH_CHUNK
+from tree_walker import walk_tree
+
+# Keep a few jobs queued per worker so the walk never runs far ahead of the copies
+QUEUE_PER_WORKER = 4
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409
+CHUNK_LIMIT = 1 << 30
+# Errors meaning "this method does not work for these two files", not "the copy failed"
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY,
+                   errno.EINVAL, errno.EBADF, errno.ENOTSUP, errno.EPERM}
+
+
+def _reflink(s_file, d_file, size):
+    fcntl.ioctl(d_file.fileno(), FICLONE, s_file.fileno())
+
+def _check_sent(sent, offset, size, method):
+    # A kernel copy that moves nothing at the start (some filesystems, e.g. procfs, report
+    # data they cannot copy this way) falls back to copy2; one that stops part-way means
+    # the source changed under it, and the copy must not pass as complete
+    if sent:
+        return
+    if offset == 0:
+        raise OSError(errno.ENOSYS, f"{method} copied nothing")
+    raise OSError(errno.EIO, f"{method} stopped at {offset} of {size} bytes, source changed during copy")
+
+def _copy_file_range(s_file, d_file, size):
+    offset = 0
+    while offset < size:
+        sent = os.copy_file_range(s_file.fileno(), d_file.fileno(), min(size - offset, CHUNK_LIMIT))
+        _check_sent(sent, offset, size, "copy_file_range")
+        offset += sent
+
+def _sendfile(s_file, d_file, size):
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(d_file.fileno(), s_file.fileno(), offset, min(size - offset, CHUNK_LIMIT))
+        _check_sent(sent, offset, size, "sendfile")
+        offset += sent
+
+KERNEL_METHODS = {}
+if fcntl is not None and sys.platform.startswith("linux"):
+    KERNEL_METHODS["reflink"] = _reflink
+if hasattr(os, "copy_file_range"):
+    KERNEL_METHODS["copy_file_range"] = _copy_file_range
+if hasattr(os, "sendfile"):
+    KERNEL_METHODS["sendfile"] = _sendfile
+COPY_BACKENDS = ("copy2", "auto", "reflink", "copy_file_range", "sendfile")
+
+
+def copy_file(s_path, d_path, backend="copy2"):
+    # Returns the method that actually moved the data
+    if backend == "auto":
+        methods = list(KERNEL_METHODS)
+    else:
+        methods = [backend] if backend in KERNEL_METHODS else []
+    for method in methods:
+        try:
+            with open(s_path, "rb") as s_file, open(d_path, "wb") as d_file:
+                KERNEL_METHODS[method](s_file, d_file, os.fstat(s_file.fileno()).st_size)
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS:
+                raise
+            continue
+        shutil.copystat(s_path, d_path)
+        return method
+    shutil.copy2(s_path, d_path)
+    return "copy2"
+
+def hash_copy(s_path, d_path):
+    # One read of the source both writes the copy and hashes it
+    h = hashlib.sha256()
+    buf = bytearray(HASH_CHUNK)
+    view = memoryview(buf)
+    with open(s_path, "rb") as s_file, open(d_path, "wb") as d_file:
+        while True:
+            n = s_file.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+            d_file.write(view[:n])
+    shutil.copystat(s_path, d_path)
+    return h.hexdigest()
+
+def make_copier(backend="copy2", metrics=None, hashes=None):
+    # With a hashes dict and the copy2 backend, each source's sha256 is recorded under
+    # its path as it is copied; kernel backends never see the data, so they record nothing
+    backend = (backend or "copy2").strip().lower()
+    if backend not in COPY_BACKENDS:
+        raise ValueError(f"Unknown copy backend '{backend}'")
+
+    def copier(s_path, d_path):
+        start = time.perf_counter()
+        if hashes is not None and backend == "copy2":
+            hashes[s_path] = hash_copy(s_path, d_path)
+            method = "copy2"
+        else:
+            method = copy_file(s_path, d_path, backend)
+        if metrics is not None:
+            metrics.file_done(s_path, time.perf_counter() - start, "copy")
+        return method
+    return copier
+
+def describe_methods(counter):
+    return ", ".join(f"{method}: {count}" for method, count in counter.most_common())
+
+
+def walk_copy_jobs(src, dst, dir_pairs=None, include=None, exclude=None):
+    os.makedirs(dst, exist_ok=True)
+    for entry in walk_tree(src, include, exclude, dirs=True):
+        d_path = os.path.join(dst, *entry.rel_path.split("/"))
+        if entry.is_dir:
+            os.makedirs(d_path, exist_ok=True)
+            if dir_pairs is not None:
+                dir_pairs.append((entry.path, d_path))
+        else:
+            # A file that could not be stat'ed is still queued so the copy reports it
+            yield entry.path, d_path, entry.stat.st_size if entry.stat else 0, entry
+
+def _run_job(copy_fn, job):
+    return copy_fn(job[0], job[1])
+
+def copy_files(jobs, workers=1, copy_fn=shutil.copy2, on_copied=None):
+    copied = copied_bytes = 0
+    errors = []
+
+    def collect(job, result=None, error=None):
+        nonlocal copied, copied_bytes
+        if error is not None:
+            errors.append((job[0], str(error)))
+            return
+        copied += 1
+        copied_bytes += job[2]
+        if on_copied:
+            on_copied(job, result)
+
+    def collect_future(future):
+        job = pending.pop(future)
+        error = future.exception()
+        collect(job, None if error else future.result(), error)
+
+    if workers <= 1:
+        for job in jobs:
+            try:
+                result = copy_fn(job[0], job[1])
+            except Exception as e:
+                collect(job, error=e)
+            else:
+                collect(job, result)
+        return copied, copied_bytes, errors
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for job in jobs:
+            pending[pool.submit(_run_job, copy_fn, job)] = job
+            if len(pending) >= workers * QUEUE_PER_WORKER:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect_future(future)
+        for future in list(pending):
+            collect_future(future)
+    return copied, copied_bytes, errors
@@ -0,0 +1,255 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime
+
+from logger import log_message
+from manifest import safe_name, source_id
+from metrics import current as current_metrics
+from throttle import current as current_throttle
+from tree_walker import walk_tree
+
+STORE_DIR = ".dedup"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# FastCDC-style content-defined chunking: no cut before MIN_CHUNK, a strict mask
+# up to AVG_CHUNK, a looser one after it, and a forced cut at MAX_CHUNK
+MIN_CHUNK = 256 * 1024
+AVG_CHUNK = 1024 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+_M64 = (1 << 64) - 1
+MASK_STRICT = ((1 << 22) - 1) << 42
+MASK_LOOSE = ((1 << 18) - 1) << 46
+GEAR = [random.Random(0x5EED + i).getrandbits(64) for i in range(256)]
+
+
+def store_path(dst, *parts):
+    return os.path.join(dst, STORE_DIR, *parts)
+
+def chunk_path(dst, digest):
+    return store_path(dst, "chunks", digest[:2], digest)
+
+def find_cut(buf):
+    n = len(buf)
+    if n <= MIN_CHUNK:
+        return n
+    gear = GEAR
+    h = 0
+    i = MIN_CHUNK
+    normal = min(AVG_CHUNK, n)
+    while i < normal:
+        h = ((h << 1) + gear[buf[i]]) & _M64
+        i += 1
+        if not h & MASK_STRICT:
+            return i
+    while i < n:
+        h = ((h << 1) + gear[buf[i]]) & _M64
+        i += 1
+        if not h & MASK_LOOSE:
+            return i
+    return n
+
+def iter_chunks(path):
+    with open(path, "rb") as f:
+        buf = f.read(MAX_CHUNK)
+        while buf:
+            cut = find_cut(buf)
+            yield buf[:cut]
+            buf = buf[cut:]
+            if len(buf) < MAX_CHUNK:
+                buf += f.read(MAX_CHUNK - len(buf))
+
+def put_chunk(dst, data, known):
+    digest = hashlib.sha256(data).hexdigest()
+    if digest in known:
+        return digest, False
+    path = chunk_path(dst, digest)
+    known.add(digest)
+    if os.path.exists(path):
+        return digest, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return digest, True
+
+def snapshot_pattern(task_name, src=None):
+    # <task>-<source id>-<stamp>.json.gz, or ...-<stamp>-<n>.json.gz for later runs in the same
+    # second. Rows of one task may share a store, so each source keeps its own snapshots.
+    # Without a source any id matches, and so do snapshots named before ids were added.
+    sid = re.escape(source_id(src)) if src else r"(?:[0-9a-f]{12}-)?"
+    if src:
+        sid += "-"
+    return re.compile(re.escape(safe_name(task_name)) + "-" + sid + r"(\d{8}-\d{6})(?:-(\d+))?\.json\.gz")
+
+def list_snapshots(dst, task_name, src=None):
+    # Oldest first. The exact match keeps task "A" from listing the snapshots of "A-B".
+    folder = store_path(dst, "snapshots")
+    if not os.path.isdir(folder):
+        return []
+    pattern = snapshot_pattern(task_name, src)
+    found = []
+    for n in os.listdir(folder):
+        match = pattern.fullmatch(n)
+        if match:
+            found.append((match.group(1), int(match.group(2) or 1), n))
+    return [n for _, _, n in sorted(found)]
+
+def load_snapshot(dst, name):
+    with gzip.open(store_path(dst, "snapshots", name), "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_snapshot(dst, name, snapshot):
+    path = store_path(dst, "snapshots", name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+def dedup_backup(src, dst, task_name, include=None, exclude=None):
+    try:
+        if not os.path.isdir(src):
+            log_message(f"Source path '{src}' is not a directory")
+            return False, f"Source path '{src}' is not a directory"
+        previous = list_snapshots(dst, task_name, src)
+        prev_files = load_snapshot(dst, previous[-1])["files"] if previous else {}
+        # Chunks referenced by the last snapshot are known to be in the store
+        known = {c for entry in prev_files.values() for c in entry["chunks"]}
+        files = {}
+        errors = []
+        new_chunks = new_bytes = reused_files = 0
+        metrics = current_metrics()
+        for item in metrics.timed(walk_tree(src, include, exclude), "scan"):
+            try:
+                st = item.stat or os.stat(item.path)
+                prev = prev_files.get(item.rel_path)
+                if prev and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime_ns:
+                    files[item.rel_path] = prev
+                    reused_files += 1
+                    metrics.skip(1, st.st_size)
+                    continue
+                current_throttle().consume(st.st_size)
+                chunks = []
+                start = time.perf_counter()
+                for data in iter_chunks(item.path):
+                    digest, stored = put_chunk(dst, data, known)
+                    chunks.append(digest)
+                    if stored:
+                        new_chunks += 1
+                        new_bytes += len(data)
+                files[item.rel_path] = {"size": st.st_size, "mtime": st.st_mtime_ns, "chunks": chunks}
+                metrics.file_done(item.path, time.perf_counter() - start, "chunk")
+                metrics.count(1, st.st_size)
+            except Exception as e:
+                errors.append((item.path, str(e)))
+        stamp = datetime.now()
+        prefix = f"{safe_name(task_name)}-{source_id(src)}-{stamp:%Y%m%d-%H%M%S}"
+        name = prefix
+        suffix = 1
+        while os.path.exists(store_path(dst, "snapshots", f"{name}.json.gz")):
+            suffix += 1
+            name = f"{prefix}-{suffix}"
+        name += ".json.gz"
+        save_snapshot(dst, name, {"task": task_name, "source": src, "time": stamp.strftime(TIME_FORMAT), "files": files})
+        msg = (f"Snapshot {name}: {len(files)} files, {reused_files} unchanged, "
+               f"{new_chunks} new chunks ({new_bytes} bytes)")
+        if errors:
+            for path, error in errors:
+                log_message(f"Failed to back up '{path}': {error}")
+            return False, f"{msg}, {len(errors)} failed"
+        return True, msg
+    except Exception as e:
+        log_message(f"Error in dedup_backup: {e}")
+        return False, str(e)
+
+def pick_snapshot(dst, task_name, snapshot=None, src=None):
+    names = list_snapshots(dst, task_name, src)
+    if snapshot:
+        names = [n for n in names if n == snapshot or n.startswith(snapshot)]
+    if not names:
+        source = f" from '{src}'" if src else ""
+        raise ValueError(f"No snapshot of '{task_name}'{source} in '{dst}'")
+    if not snapshot and not src and len({snapshot_source(n, task_name) for n in names}) > 1:
+        raise ValueError(f"'{task_name}' has snapshots of several sources in '{dst}', pass a source")
+    return names[-1]
+
+def snapshot_source(name, task_name):
+    # The source id part of a snapshot name, or "" for one named before ids were added
+    rest = name[len(safe_name(task_name)) + 1:]
+    return rest[:12] if re.match(r"[0-9a-f]{12}-", rest) else ""
+
+def restore_snapshot(dst, task_name, target, snapshot=None, src=None):
+    name = pick_snapshot(dst, task_name, snapshot, src)
+    files = load_snapshot(dst, name)["files"]
+    for rel_path, entry in files.items():
+        out_path = os.path.join(target, *rel_path.split("/"))
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "wb") as out:
+            for digest in entry["chunks"]:
+                with open(chunk_path(dst, digest), "rb") as f:
+                    out.write(f.read())
+        os.utime(out_path, ns=(entry["mtime"], entry["mtime"]))
+    return name, len(files)
+
+def verify_snapshot(dst, task_name, snapshot=None, src=None):
+    name = pick_snapshot(dst, task_name, snapshot, src)
+    files = load_snapshot(dst, name)["files"]
+    problems = []
+    checked = set()
+    for rel_path, entry in files.items():
+        size = 0
+        damaged = False
+        for digest in entry["chunks"]:
+            try:
+                with open(chunk_path(dst, digest), "rb") as f:
+                    data = f.read()
+            except OSError:
+                problems.append(f"{rel_path}: missing chunk {digest}")
+                damaged = True
+                continue
+            size += len(data)
+            if digest not in checked:
+                if hashlib.sha256(data).hexdigest() != digest:
+                    problems.append(f"{rel_path}: corrupt chunk {digest}")
+                    damaged = True
+                checked.add(digest)
+        if not damaged and size != entry["size"]:
+            problems.append(f"{rel_path}: expected {entry['size']} bytes, store has {size}")
+    return name, problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Restore and verify deduplicated backups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command in ("list", "restore", "verify"):
+        cmd = sub.add_parser(command)
+        cmd.add_argument("dest")
+        cmd.add_argument("task")
+        cmd.add_argument("--source", help="Source folder of the task row (default: any)")
+        if command == "restore":
+            cmd.add_argument("target")
+        if command != "list":
+            cmd.add_argument("--snapshot", help="Snapshot name or prefix (default: latest)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name in list_snapshots(args.dest, args.task, args.source):
+            print(name)
+    elif args.command == "restore":
+        name, count = restore_snapshot(args.dest, args.task, args.target, args.snapshot, args.source)
+        print(f"Restored {count} files from {name} into {args.target}")
+    else:
+        name, problems = verify_snapshot(args.dest, args.task, args.snapshot, args.source)
+        for problem in problems:
+            print(problem)
+        print(f"{name}: {'OK' if not problems else f'{len(problems)} problems'}")
+        raise SystemExit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
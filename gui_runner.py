@@ -0,0 +1,185 @@
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from tkinter import ttk
+from datetime import timedelta
+from logger import log_message, human_size
+from tree_walker import walk_tree, parse_patterns
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKUP_SCRIPT = os.path.join(SCRIPT_DIR, 'BackupProcess.py')
+POLL_MS = 200
+STDERR_LINES = 5               # lines of a crashed child's stderr shown in the window
+TERMINATE_SECONDS = 10         # time a cancelled child gets to exit before it is killed
+
+
+def estimate_totals(tasks, cancelled):
+    # Files and bytes the run will look at, for the progress bar and ETA
+    files = nbytes = 0
+    for t in tasks:
+        # Unreadable folders only make the estimate low; the run itself reports them
+        for item in walk_tree(t["source"], parse_patterns(t.get("Include")), parse_patterns(t.get("Exclude")),
+                              onerror=lambda e: None):
+            if cancelled.is_set():
+                return None
+            files += 1
+            nbytes += item.stat.st_size if item.stat else 0
+    return files, nbytes
+
+
+class RunWindow(tk.Toplevel):
+    # Runs BackupProcess in a child process so the Tk mainloop never blocks. Worker
+    # threads read its --progress lines and estimate totals; the window drains their
+    # queue with after(). Cancel terminates the child, and kills it if it does not exit:
+    # checkpoint journals let the next run pick up where it stopped.
+
+    def __init__(self, master, title, args, tasks):
+        super().__init__(master)
+        self.title(title)
+        self.geometry("520x150")
+        self.tasks = tasks
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+        self.started = time.monotonic()
+        self.progress = {}
+        self.totals = None
+        self.finished = False
+        self.stderr_tail = deque(maxlen=STDERR_LINES)
+
+        self.status = tk.StringVar(value="Starting...")
+        self.detail = tk.StringVar()
+        tk.Label(self, textvariable=self.status, anchor='w').pack(fill=tk.X, padx=10, pady=(12, 2))
+        self.bar = ttk.Progressbar(self, mode="indeterminate", length=500)
+        self.bar.pack(padx=10, pady=4)
+        self.bar.start(50)
+        tk.Label(self, textvariable=self.detail, anchor='w', justify=tk.LEFT, wraplength=500).pack(fill=tk.X, padx=10)
+        self.button = tk.Button(self, text="Cancel", command=self.cancel, width=10)
+        self.button.pack(pady=8)
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        self.proc = subprocess.Popen(
+            [sys.executable, BACKUP_SCRIPT, "--progress"] + args, cwd=SCRIPT_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        self.stderr_reader = threading.Thread(target=self.read_stderr, daemon=True)
+        self.stderr_reader.start()
+        threading.Thread(target=self.read_progress, daemon=True).start()
+        threading.Thread(target=self.estimate, daemon=True).start()
+        self.poll_id = self.after(POLL_MS, self.poll)
+
+    def read_progress(self):
+        for line in self.proc.stdout:
+            try:
+                self.events.put(("progress", json.loads(line)))
+            except ValueError:
+                continue
+        exit_code = self.proc.wait()
+        self.stderr_reader.join(1)
+        self.events.put(("exit", exit_code))
+
+    def read_stderr(self):
+        # Drained all along so the child never blocks on a full pipe; only the tail is kept
+        for line in self.proc.stderr:
+            if line.strip():
+                self.stderr_tail.append(line.rstrip())
+
+    def estimate(self):
+        try:
+            totals = estimate_totals(self.tasks, self.cancelled)
+        except Exception as e:
+            log_message(f"Error estimating run size: {e}")
+            return
+        if totals is not None:
+            self.events.put(("totals", totals))
+
+    def poll(self):
+        exit_code = None
+        while True:
+            try:
+                kind, data = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                for p in data["tasks"]:
+                    self.progress[p["task"]] = p
+            elif kind == "totals":
+                self.totals = data
+            else:
+                exit_code = data
+        self.show_progress()
+        if exit_code is not None:
+            self.done(exit_code)
+        elif not self.finished:
+            self.poll_id = self.after(POLL_MS, self.poll)
+
+    def show_progress(self):
+        tasks = list(self.progress.values())
+        files = sum(p["files"] + p["skipped_files"] for p in tasks)
+        nbytes = sum(p["bytes"] + p["skipped_bytes"] for p in tasks)
+        elapsed = time.monotonic() - self.started
+        running = [p["task"] for p in tasks if not p["done"]]
+        if running:
+            self.status.set(f"Running: {', '.join(running)}")
+        text = f"{files} files, {human_size(nbytes)}"
+        if self.totals:
+            total_files, total_bytes = self.totals
+            text = f"{files} / {total_files} files, {human_size(nbytes)} / {human_size(total_bytes)}"
+            if self.bar["mode"] != "determinate":
+                self.bar.stop()
+                self.bar.configure(mode="determinate", maximum=max(total_bytes, 1))
+            self.bar["value"] = min(nbytes, total_bytes)
+            rate = nbytes / elapsed if elapsed > 0 else 0
+            if rate > 0 and total_bytes > nbytes:
+                text += f", ETA {timedelta(seconds=int((total_bytes - nbytes) / rate))}"
+        self.detail.set(f"{text}, elapsed {timedelta(seconds=int(elapsed))}")
+
+    def done(self, exit_code):
+        self.finished = True
+        self.cancelled.set()
+        self.bar.stop()
+        if self.bar["mode"] == "determinate":
+            self.bar["value"] = self.bar["maximum"]
+        failed = [p["task"] for p in self.progress.values() if p["done"] and not p["success"]]
+        if exit_code != 0:
+            self.status.set(f"Backup process exited with code {exit_code}")
+            if self.stderr_tail:
+                self.detail.set("\n".join(self.stderr_tail))
+                self.geometry("")
+        elif failed:
+            self.status.set(f"Finished with failures: {', '.join(failed)}")
+        else:
+            self.status.set("Finished")
+        self.button.configure(text="Close", command=self.destroy)
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
+
+    def cancel(self):
+        if self.finished:
+            self.destroy()
+            return
+        self.finished = True
+        self.cancelled.set()
+        self.after_cancel(self.poll_id)
+        self.proc.terminate()
+        threading.Thread(target=self.kill_if_running, daemon=True).start()
+        # The terminated child writes no row for its unfinished tasks; record them the way a
+        # finished task is recorded, in backup_log.csv and the catalog
+        from BackupProcess import log_execution
+        for p in self.progress.values():
+            if not p["done"]:
+                log_message(f"Task {p['task']} cancelled from the GUI")
+                t = next((t for t in self.tasks if t["task_name"] == p["task"]), {})
+                log_execution(p["task"], t.get("source", ""), t.get("backup", ""), p["type"], "Cancelled",
+                              f"Cancelled after {p['files']} files ({human_size(p['bytes'])})")
+        self.destroy()
+
+    def kill_if_running(self):
+        try:
+            self.proc.wait(TERMINATE_SECONDS)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
@@ -1,18 +1,117 @@
-import os
+import atexit
 import datetime
+import os
+import threading
 
 # By default, use the folder containing the main script
 LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "debug.txt")
+LOG_FORMAT = "text"            # "text" or "json" (one JSON object per line)
+MAX_LOG_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+FLUSH_INTERVAL = 1.0           # seconds between background flushes
+FLUSH_LINES = 1000             # flush early once this many lines are buffered
+
+_logs = {}
+_logs_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+
+
+class BufferedLog:
+    # Collects lines in memory; the flusher thread appends them in one write
+
+    def __init__(self, path, header=None, max_bytes=0, backups=0, newline=None):
+        self.path = path
+        self.header = header
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.newline = newline
+        self.lines = []
+        self.lock = threading.Lock()
+
+    def write(self, line):
+        with self.lock:
+            self.lines.append(line)
+            full = len(self.lines) >= FLUSH_LINES
+        if full:
+            _wakeup.set()
+
+    def flush(self):
+        with self.lock:
+            if not self.lines:
+                return
+            lines, self.lines = self.lines, []
+            data = "".join(lines)
+            try:
+                if self.max_bytes and os.path.exists(self.path) \
+                        and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                    self.rotate()
+                is_new = not os.path.exists(self.path)
+                with open(self.path, "a", encoding="utf-8", newline=self.newline) as f:
+                    if is_new and self.header:
+                        f.write(self.header)
+                    f.write(data)
+            except Exception:
+                pass
+
+    def rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+def get_log(path, header=None, max_bytes=0, backups=0, newline=None):
+    global _flusher
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = BufferedLog(path, header, max_bytes, backups, newline)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="log-flusher", daemon=True)
+            _flusher.start()
+    return log
+
+def flush_logs():
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        log.flush()
+
+def _flush_loop():
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        flush_logs()
+
+atexit.register(flush_logs)
 
 def log_message(msg):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    full_line = f"[{timestamp}] {msg}\n"
-    try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(full_line)
-    except Exception:
-        pass
+    now = datetime.datetime.now()
+    if LOG_FORMAT == "json":
+        import json
+        full_line = json.dumps({"time": now.isoformat(timespec="milliseconds"), "message": str(msg)}) + "\n"
+    else:
+        full_line = f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] {msg}\n"
+    get_log(LOG_FILE, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS).write(full_line)
+
+def human_size(num):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num < 1024:
+            return f"{num:.1f} {unit}" if unit != "B" else f"{num} B"
+        num /= 1024
+    return f"{num:.1f} TB"
 
 def set_log_file(path):
     global LOG_FILE
+    flush_logs()
     LOG_FILE = path
+
+def set_log_format(fmt):
+    global LOG_FORMAT
+    if fmt not in ("text", "json"):
+        raise ValueError(f"Unknown log format '{fmt}'")
+    LOG_FORMAT = fmt
@@ -0,0 +1,42 @@
+import hashlib
+import json
+import os
+
+# Per-task bookkeeping lives in a hidden folder inside the destination
+META_DIR = ".backup_meta"
+HASH_CHUNK = 1024 * 1024
+
+
+def safe_name(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+def source_id(src):
+    # Short stable id of a source folder: the rows of one task may share a destination,
+    # so files kept per source carry it next to the task name
+    return hashlib.sha1(os.path.normcase(os.path.abspath(src)).encode("utf-8")).hexdigest()[:12]
+
+def meta_path(dst, filename):
+    return os.path.join(dst, META_DIR, filename)
+
+def manifest_path(dst, task_name):
+    return meta_path(dst, f"{safe_name(task_name)}.manifest.json")
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,160 @@
+import heapq
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SLOWEST_FILES = 5
+
+_local = threading.local()
+_finished = []
+_latest = {}
+_running = {}
+_finished_lock = threading.Lock()
+
+
+class TaskMetrics:
+    # Counters for one task run; file_done may be called from worker threads
+
+    def __init__(self, task_name, backup_type):
+        self.task_name = task_name
+        self.backup_type = backup_type
+        self.started = time.time()
+        self.duration = 0.0
+        self.files = 0
+        self.bytes = 0
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.phases = {}
+        self.slowest = []
+        self.success = None
+        self.lock = threading.Lock()
+
+    def add_phase(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.perf_counter() - start)
+
+    def timed(self, iterable, phase):
+        # Charges the time spent producing each item (e.g. walking the tree) to phase
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add_phase(phase, time.perf_counter() - start)
+                return
+            self.add_phase(phase, time.perf_counter() - start)
+            yield item
+
+    def file_done(self, path, seconds, phase):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            if len(self.slowest) < SLOWEST_FILES:
+                heapq.heappush(self.slowest, (seconds, path))
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, path))
+
+    def count(self, files, nbytes):
+        with self.lock:
+            self.files += files
+            self.bytes += nbytes
+
+    def skip(self, files, nbytes):
+        # Unchanged files a run looked at but did not need to write; only used for progress
+        with self.lock:
+            self.skipped_files += files
+            self.skipped_bytes += nbytes
+
+    def progress(self):
+        with self.lock:
+            return {"task": self.task_name, "type": self.backup_type, "files": self.files,
+                    "bytes": self.bytes, "skipped_files": self.skipped_files,
+                    "skipped_bytes": self.skipped_bytes, "elapsed": round(time.time() - self.started, 3),
+                    "done": self.success is not None, "success": self.success}
+
+    def finish(self, success):
+        self.success = bool(success)
+        self.duration = time.time() - self.started
+        with _finished_lock:
+            _finished.append(self)
+            _running.pop(id(self), None)
+
+def start_task(task_name, backup_type):
+    _local.metrics = TaskMetrics(task_name, backup_type)
+    with _finished_lock:
+        _running[id(_local.metrics)] = _local.metrics
+    return _local.metrics
+
+def recent():
+    # Tasks still running plus those finished since the last write_prometheus
+    with _finished_lock:
+        return list(_running.values()) + _finished
+
+def current():
+    # Outside a task run (tools, benchmarks) measurements go to a throwaway instance
+    metrics = getattr(_local, "metrics", None)
+    return metrics if metrics is not None else TaskMetrics("", "")
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def render_prometheus(runs):
+    metric_lines = {
+        "backup_task_success": ("gauge", "1 if the last run of the task succeeded"),
+        "backup_task_last_run_timestamp_seconds": ("gauge", "Start time of the last run"),
+        "backup_task_duration_seconds": ("gauge", "Wall time of the last run"),
+        "backup_task_files": ("gauge", "Files processed by the last run"),
+        "backup_task_bytes": ("gauge", "Bytes processed by the last run"),
+        "backup_task_files_per_second": ("gauge", "Files per second over the last run"),
+        "backup_task_bytes_per_second": ("gauge", "Bytes per second over the last run"),
+        "backup_task_phase_seconds": ("gauge", "Time per phase; summed across workers for parallel phases"),
+        "backup_task_slowest_file_seconds": ("gauge", "Slowest files of the last run"),
+    }
+    samples = {name: [] for name in metric_lines}
+    for run in runs:
+        labels = f'task="{_label(run.task_name)}",type="{_label(run.backup_type)}"'
+        duration = max(run.duration, 1e-9)
+        samples["backup_task_success"].append((labels, 1 if run.success else 0))
+        samples["backup_task_last_run_timestamp_seconds"].append((labels, round(run.started, 3)))
+        samples["backup_task_duration_seconds"].append((labels, round(run.duration, 6)))
+        samples["backup_task_files"].append((labels, run.files))
+        samples["backup_task_bytes"].append((labels, run.bytes))
+        samples["backup_task_files_per_second"].append((labels, round(run.files / duration, 3)))
+        samples["backup_task_bytes_per_second"].append((labels, round(run.bytes / duration, 3)))
+        for phase, seconds in sorted(run.phases.items()):
+            samples["backup_task_phase_seconds"].append((f'{labels},phase="{phase}"', round(seconds, 6)))
+        for seconds, path in sorted(run.slowest, reverse=True):
+            samples["backup_task_slowest_file_seconds"].append((f'{labels},path="{_label(path)}"', round(seconds, 6)))
+    out = []
+    for name, (kind, help_text) in metric_lines.items():
+        if not samples[name]:
+            continue
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(f"{name}{{{labels}}} {value}" for labels, value in samples[name])
+    return "\n".join(out) + "\n"
+
+def write_prometheus(path):
+    # Writes the last run of every task finished in this process (a long-running
+    # scheduler keeps earlier tasks in the file); the rename keeps textfile collectors
+    # from ever reading a half-written file
+    with _finished_lock:
+        if not _finished:
+            return
+        for run in _finished:
+            _latest[(run.task_name, run.backup_type)] = run
+        _finished.clear()
+        runs = list(_latest.values())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(render_prometheus(runs))
+    os.replace(tmp_path, path)
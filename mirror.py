@@ -0,0 +1,210 @@
+import os
+import shutil
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from checkpoint import CHECKPOINT_SECONDS
+from copy_engine import copy_files, make_copier
+from logger import log_message
+from manifest import META_DIR, manifest_path, load_manifest, save_manifest, file_hash
+from metrics import current as current_metrics
+from throttle import current as current_throttle
+from tree_walker import walk_tree
+
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+# Trash of a first run without Trash set: the destination may hold files of other
+# tasks, so what the source lacks is moved aside rather than deleted
+FIRST_RUN_TRASH = ".mirror_trash"
+
+
+def trash_root(dst, trash):
+    # Trash may be relative to the destination; each run gets its own timestamped folder
+    if not trash:
+        return None
+    folder = trash if os.path.isabs(trash) else os.path.join(dst, trash)
+    return os.path.join(folder, datetime.now().strftime(STAMP_FORMAT))
+
+def scan_destination(dst, skip):
+    # Index of an existing destination, for the first mirror run (no manifest yet)
+    index = {}
+    for item in walk_tree(dst, exclude=[META_DIR]):
+        if item.stat is None or any(item.path == s or item.path.startswith(s + os.sep) for s in skip):
+            continue
+        index[item.rel_path] = {"size": item.stat.st_size, "mtime": item.stat.st_mtime_ns}
+    return index
+
+def remove_file(d_path, rel_path, trash_dir):
+    if trash_dir:
+        t_path = os.path.join(trash_dir, *rel_path.split("/"))
+        os.makedirs(os.path.dirname(t_path), exist_ok=True)
+        shutil.move(d_path, t_path)
+    else:
+        os.remove(d_path)
+
+def prune_dirs(dst, rel_paths, src_dirs):
+    # Folders emptied by deletions and renames go too, unless the source still has them
+    parents = {p.rsplit("/", 1)[0] for p in rel_paths if "/" in p}
+    for rel_dir in sorted(parents, key=lambda p: p.count("/"), reverse=True):
+        while rel_dir and rel_dir not in src_dirs:
+            try:
+                os.rmdir(os.path.join(dst, *rel_dir.split("/")))
+            except OSError:
+                break
+            rel_dir = rel_dir.rsplit("/", 1)[0] if "/" in rel_dir else ""
+
+def mirror_folder(src, dst, task_name, workers=1, include=None, exclude=None, backend="copy2",
+                  hashes=None, trash=None):
+    # Makes dst an exact copy of src: a diff of the source tree against the destination
+    # index (the manifest) yields copies, deletions and renames. A file missing from its
+    # old path with a new path of the same size and hash is renamed on the destination
+    # instead of being copied again. Nothing is deleted or renamed when part of the
+    # source could not be read, since its files would look gone.
+    try:
+        if not os.path.isdir(src):
+            log_message(f"Source path '{src}' is not a directory")
+            return False, f"Source path '{src}' is not a directory"
+        os.makedirs(dst, exist_ok=True)
+        m_path = manifest_path(dst, task_name)
+        first_run = not os.path.exists(m_path)
+        trash_dir = trash_root(dst, trash or (FIRST_RUN_TRASH if first_run else None))
+        m = current_metrics()
+        scan_errors = []
+        with m.phase("scan"):
+            if first_run:
+                dest_index = scan_destination(dst, [os.path.dirname(trash_dir)])
+            else:
+                dest_index = load_manifest(m_path)
+            src_index = {}
+            src_dirs = set()
+            for item in walk_tree(src, include, exclude, dirs=True, onerror=scan_errors.append):
+                if item.is_dir:
+                    src_dirs.add(item.rel_path)
+                else:
+                    src_index[item.rel_path] = item
+        if not src_index and dest_index:
+            # An unmounted or emptied source must not wipe the mirror
+            return False, f"Source '{src}' is empty, refusing to delete {len(dest_index)} mirrored files"
+
+        new_index = {}
+        changed = []
+        added = []
+        for rel_path, item in src_index.items():
+            st = item.stat
+            prev = dest_index.get(rel_path)
+            if st is not None and prev and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime_ns:
+                new_index[rel_path] = prev
+                m.skip(1, st.st_size)
+            elif prev:
+                changed.append(rel_path)
+            else:
+                added.append(rel_path)
+        gone = {p for p in dest_index if p not in src_index}
+        if scan_errors:
+            for e in scan_errors:
+                log_message(f"Mirror cannot read '{e.filename}': {e.strerror or e}")
+            # Kept in the index, so a later complete scan still deletes what is really gone
+            for rel_path in gone:
+                new_index[rel_path] = dest_index[rel_path]
+            gone = set()
+
+        renamed = renamed_bytes = 0
+        if added and gone:
+            with m.phase("rename"):
+                by_size = defaultdict(list)
+                for rel_path in sorted(gone):
+                    by_size[dest_index[rel_path]["size"]].append(rel_path)
+                for rel_path in added:
+                    st = src_index[rel_path].stat
+                    candidates = by_size.get(st.st_size) if st is not None else None
+                    if not candidates:
+                        continue
+                    digest = file_hash(src_index[rel_path].path)
+                    for old in candidates:
+                        old_path = os.path.join(dst, *old.split("/"))
+                        old_hash = dest_index[old].get("hash")
+                        if old_hash is None:
+                            try:
+                                old_hash = file_hash(old_path)
+                            except OSError:
+                                continue
+                        if old_hash != digest:
+                            continue
+                        d_path = os.path.join(dst, *rel_path.split("/"))
+                        try:
+                            os.makedirs(os.path.dirname(d_path), exist_ok=True)
+                            os.replace(old_path, d_path)
+                            shutil.copystat(src_index[rel_path].path, d_path)
+                        except OSError:
+                            continue
+                        candidates.remove(old)
+                        gone.discard(old)
+                        new_index[rel_path] = {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": digest}
+                        if hashes is not None:
+                            hashes[src_index[rel_path].path] = digest
+                        renamed += 1
+                        renamed_bytes += st.st_size
+                        m.skip(1, st.st_size)
+                        break
+
+        deleted = 0
+        errors = []
+        with m.phase("delete"):
+            # With a trash folder the old version of a changed file goes there too;
+            # without one it is simply overwritten by the copy
+            for rel_path in sorted(gone) + (changed if trash_dir else []):
+                d_path = os.path.join(dst, *rel_path.split("/"))
+                try:
+                    remove_file(d_path, rel_path, trash_dir)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    errors.append((d_path, str(e)))
+                    continue
+                deleted += rel_path in gone
+            if not scan_errors:
+                prune_dirs(dst, set(dest_index) - set(src_index), src_dirs)
+        for rel_dir in sorted(src_dirs):
+            os.makedirs(os.path.join(dst, *rel_dir.split("/")), exist_ok=True)
+
+        jobs = []
+        for rel_path in changed + [p for p in added if p not in new_index]:
+            item = src_index[rel_path]
+            jobs.append((item.path, os.path.join(dst, *rel_path.split("/")), item.stat.st_size if item.stat else 0, item))
+        # Hashing while copying gives the index the hashes later rename checks compare against
+        copy_hashes = hashes if hashes is not None else {}
+        last_checkpoint = time.monotonic()
+
+        def on_copied(job, method):
+            nonlocal last_checkpoint
+            m.count(1, job[2])
+            st = job[3].stat
+            if st is not None:
+                entry = {"size": st.st_size, "mtime": st.st_mtime_ns}
+                digest = copy_hashes.get(job[0]) if hashes is not None else copy_hashes.pop(job[0], None)
+                if digest:
+                    entry["hash"] = digest
+                new_index[job[3].rel_path] = entry
+            if time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+                save_manifest(m_path, new_index)
+                last_checkpoint = time.monotonic()
+
+        jobs = current_throttle().limit(jobs, lambda job: job[2])
+        copied, copied_bytes, copy_errors = copy_files(jobs, workers, make_copier(backend, m, copy_hashes), on_copied)
+        errors += copy_errors
+        with m.phase("finalize"):
+            save_manifest(m_path, new_index)
+        msg = (f"Mirrored: copied {copied} files ({copied_bytes} bytes), renamed {renamed} ({renamed_bytes} bytes), "
+               f"deleted {deleted}")
+        if trash_dir and os.path.isdir(trash_dir):
+            msg += f", old versions in '{trash_dir}'"
+        if scan_errors:
+            msg += f", deletions skipped: {len(scan_errors)} source folders unreadable"
+        if errors:
+            for path, error in errors:
+                log_message(f"Mirror failed on '{path}': {error}")
+            return False, f"{msg}, {len(errors)} failed"
+        return not scan_errors, msg
+    except Exception as e:
+        log_message(f"Error in mirror_folder: {e}")
+        return False, str(e)
@@ -0,0 +1,277 @@
+import argparse
+import heapq
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+from logger import log_message, flush_logs
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROL_SOCKET = os.path.join(SCRIPT_DIR, 'backup_scheduler.sock')
+CONTROL_PORT = 47211           # loopback TCP where AF_UNIX is unavailable
+START_FORMAT = "%m/%d/%Y %H:%M"
+FREQUENCIES = {"Once": None, "Once in Day": timedelta(days=1), "Hourly": timedelta(hours=1)}
+
+
+def next_fire(schedule, after):
+    # First trigger time strictly after `after`, or None when the schedule never fires again
+    try:
+        start = datetime.strptime(schedule.get("Start DateTime", "").strip(), START_FORMAT)
+    except ValueError:
+        return None
+    period = FREQUENCIES.get(schedule.get("Frequency", "").strip() or "Once")
+    if start > after:
+        return start
+    if not period:
+        return None
+    return start + period * ((after - start) // period + 1)
+
+
+class SchedulerDaemon:
+    # Fires enabled schedules from a heap of (time, name) in one long-lived process.
+    # A schedule that is still running when it comes due again is skipped, like the
+    # IgnoreNew policy of the schtasks XML, and a task already running under another
+    # schedule is left out of the new run.
+
+    def __init__(self):
+        import BackupProcess
+        import metrics
+        import throttle
+        self.backup = BackupProcess
+        self.metrics = metrics
+        self.throttle = throttle
+        self.lock = threading.Condition()
+        self.heap = []
+        self.schedules = {}
+        self.task_index = {}
+        self.running_schedules = set()
+        self.running_tasks = set()
+        self.stopping = False
+        self.metrics_lock = threading.Lock()
+        self.watcher = None
+
+    def reload(self):
+        schedules, task_index = self.backup.load_index()
+        now = datetime.now()
+        with self.lock:
+            self.schedules = schedules
+            self.task_index = task_index
+            self.heap = []
+            for name, schedule in schedules.items():
+                when = next_fire(schedule, now) if self.backup.schedule_enabled(schedule) else None
+                if when is not None:
+                    self.heap.append((when, name))
+            heapq.heapify(self.heap)
+            self.lock.notify()
+        log_message(f"Scheduler loaded {len(schedules)} schedules, {len(self.heap)} pending")
+        self.reload_watches(task_index)
+
+    def reload_watches(self, task_index):
+        # Tasks with the Watch option get their change journal from this process
+        from change_watch import watch_sources, start_watcher, available
+        sources = watch_sources(t for rows in task_index.values() for t in rows)
+        if self.watcher is not None:
+            self.watcher.set_sources(sources)
+        elif sources and available():
+            try:
+                self.watcher = start_watcher(sources)
+            except OSError as e:
+                log_message(f"Cannot start the change watcher: {e}")
+
+    def fire(self, name):
+        with self.lock:
+            schedule = self.schedules.get(name)
+            if schedule is None:
+                return False, f"No schedule named '{name}'"
+            if name in self.running_schedules:
+                log_message(f"Schedule '{name}' is still running, skipping this run")
+                return False, f"Schedule '{name}' is still running"
+            tasks = [t for t in self.backup.tasks_for_schedule(schedule, self.task_index)
+                     if t["task_name"] not in self.running_tasks]
+            if not tasks:
+                return False, f"No idle tasks for schedule '{name}'"
+            self.running_schedules.add(name)
+            names = {t["task_name"] for t in tasks}
+            self.running_tasks |= names
+        threading.Thread(target=self.run, args=(schedule, tasks, names), name=f"schedule-{name}", daemon=True).start()
+        return True, f"Started schedule '{name}' ({len(tasks)} tasks)"
+
+    def run(self, schedule, tasks, names):
+        try:
+            log_message(f"Running schedule: {schedule['Schedule Name']}")
+            limits = (self.backup.task_int(schedule, "Max Parallel", 1),
+                      self.backup.task_int(schedule, "Max Per Volume", 1),
+                      self.throttle.schedule_throttle(schedule))
+            self.backup.run_tasks_at_priority(schedule.get("IO Priority"), tasks, limits)
+            self.backup.prune_snapshots(schedule, tasks)
+        except Exception as e:
+            log_message(f"Error running schedule '{schedule['Schedule Name']}': {e}")
+        finally:
+            with self.lock:
+                self.running_schedules.discard(schedule["Schedule Name"])
+                self.running_tasks -= names
+            with self.metrics_lock:
+                try:
+                    self.metrics.write_prometheus(self.backup.METRICS_FILE)
+                except Exception as e:
+                    log_message(f"Error writing metrics: {e}")
+
+    def status(self):
+        with self.lock:
+            return {
+                "pending": [{"schedule": name, "at": when.strftime("%Y-%m-%d %H:%M:%S")}
+                            for when, name in sorted(self.heap)],
+                "running": sorted(self.running_schedules),
+                "running_tasks": sorted(self.running_tasks),
+            }
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+            self.lock.notify()
+
+    def serve(self):
+        self.reload()
+        while True:
+            with self.lock:
+                while not self.stopping:
+                    timeout = None
+                    if self.heap:
+                        timeout = (self.heap[0][0] - datetime.now()).total_seconds()
+                        if timeout <= 0:
+                            break
+                    self.lock.wait(timeout)
+                if self.stopping:
+                    break
+                when, name = heapq.heappop(self.heap)
+                upcoming = next_fire(self.schedules[name], max(when, datetime.now()))
+                if upcoming is not None:
+                    heapq.heappush(self.heap, (upcoming, name))
+            self.fire(name)
+        log_message("Scheduler stopped, waiting for running schedules")
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher.thread.join()
+        while True:
+            with self.lock:
+                if not self.running_schedules:
+                    break
+            time.sleep(1)
+        flush_logs()
+
+    def handle(self, line):
+        command, _, arg = line.strip().partition(" ")
+        if command == "status":
+            return {"ok": True, **self.status()}
+        if command == "reload":
+            self.reload()
+            return {"ok": True}
+        if command == "run":
+            ok, message = self.fire(arg.strip())
+            return {"ok": ok, "message": message}
+        if command == "stop":
+            self.stop()
+            return {"ok": True}
+        return {"ok": False, "message": f"Unknown command '{command}'"}
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    # One JSON reply line per command line
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.scheduler.handle(line.decode("utf-8"))
+            except Exception as e:
+                reply = {"ok": False, "message": str(e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+
+
+def control_server(daemon):
+    if hasattr(socket, "AF_UNIX"):
+        if os.path.exists(CONTROL_SOCKET):
+            # Only a socket nobody listens on is left over from a crashed daemon; taking
+            # over a live one would leave two daemons firing the same schedules
+            try:
+                send_command("status", timeout=2)
+            except (ConnectionRefusedError, FileNotFoundError):
+                if os.path.exists(CONTROL_SOCKET):
+                    os.remove(CONTROL_SOCKET)
+            except (OSError, ValueError):
+                raise RuntimeError(f"'{CONTROL_SOCKET}' is in use but does not answer as a scheduler")
+            else:
+                raise RuntimeError(f"A scheduler is already running on '{CONTROL_SOCKET}'")
+        server = socketserver.ThreadingUnixStreamServer(CONTROL_SOCKET, ControlHandler)
+        os.chmod(CONTROL_SOCKET, 0o600)
+    else:
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", CONTROL_PORT), ControlHandler)
+    server.daemon_threads = True
+    server.scheduler = daemon
+    return server
+
+def send_command(command, timeout=5):
+    if hasattr(socket, "AF_UNIX"):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = CONTROL_SOCKET
+    else:
+        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = ("127.0.0.1", CONTROL_PORT)
+    with conn:
+        conn.settimeout(timeout)
+        conn.connect(address)
+        conn.sendall((command + "\n").encode("utf-8"))
+        return json.loads(conn.makefile("rb").readline())
+
+def notify_reload():
+    # Called after the schedule form saves; without a running daemon there is nothing to do.
+    # A stale socket or another program on the port can answer with something that is not
+    # JSON, which means the same.
+    try:
+        send_command("reload")
+    except (OSError, ValueError):
+        pass
+
+def run_daemon():
+    daemon = SchedulerDaemon()
+    server = control_server(daemon)
+    threading.Thread(target=server.serve_forever, name="scheduler-control", daemon=True).start()
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        if hasattr(socket, "AF_UNIX") and os.path.exists(CONTROL_SOCKET):
+            os.remove(CONTROL_SOCKET)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run schedules from one long-lived process")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("start", help="Run the scheduler in the foreground")
+    sub.add_parser("status", help="Show pending and running schedules")
+    sub.add_parser("reload", help="Re-read schedules and tasks from the catalog")
+    run_cmd = sub.add_parser("run", help="Start a schedule now")
+    run_cmd.add_argument("name")
+    sub.add_parser("stop", help="Stop after running schedules finish")
+    args = parser.parse_args()
+
+    if args.command == "start":
+        try:
+            run_daemon()
+        except RuntimeError as e:
+            parser.exit(1, f"{e}\n")
+        return
+    reply = send_command(f"run {args.name}" if args.command == "run" else args.command)
+    if args.command == "status":
+        for item in reply["pending"]:
+            print(f"{item['at']}  {item['schedule']}")
+        print(f"Running: {', '.join(reply['running']) or 'none'}")
+    elif reply.get("message"):
+        print(reply["message"])
+
+if __name__ == "__main__":
+    main()
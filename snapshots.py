@@ -0,0 +1,135 @@
+import argparse
+import os
+import shutil
+from datetime import datetime
+
+import catalog
+from logger import log_message
+from manifest import safe_name
+
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+SNAPSHOT_TYPES = ("normal", "incremental", "zip", "tar")
+RETENTION_FIELDS = ("Keep Last", "Keep Hourly", "Keep Daily", "Keep Weekly")
+# Each Keep <period> keeps the newest snapshot of that many recent periods
+RETENTION_PERIODS = {"Keep Hourly": "%Y-%m-%d %H", "Keep Daily": "%Y-%m-%d", "Keep Weekly": "%G-W%V"}
+
+
+def latest_snapshot(task_name, backup, history=None):
+    # Folder of the newest finished snapshot, or None
+    history = catalog.get_snapshots(task_name, backup) if history is None else history
+    good = [s for s in history if s["status"] == "Success" and os.path.isdir(s["path"])]
+    return good[0]["path"] if good else None
+
+def start_snapshot(task_name, backup):
+    # Returns (snapshot id, folder to back up into, newest good snapshot folder or None).
+    # A snapshot the previous run left unfinished is reused, so its checkpoint journal
+    # resumes the copy instead of starting over in a new folder.
+    history = catalog.get_snapshots(task_name, backup)
+    base = latest_snapshot(task_name, backup, history)
+    if history and history[0]["status"] != "Success" and os.path.isdir(history[0]["path"]):
+        catalog.set_snapshot_status(history[0]["id"], "Running")
+        return history[0]["id"], history[0]["path"], base
+    now = datetime.now()
+    name = f"{safe_name(task_name)}-{now.strftime(STAMP_FORMAT)}"
+    path = os.path.join(backup, name)
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(backup, f"{name}-{suffix}")
+    os.makedirs(path)
+    return catalog.add_snapshot(task_name, backup, path, now.strftime(TIME_FORMAT)), path, base
+
+def finish_snapshot(snapshot_id, status):
+    catalog.set_snapshot_status(snapshot_id, "Success" if status else "Failed")
+
+def retention_policy(settings):
+    policy = {}
+    for field in RETENTION_FIELDS:
+        try:
+            policy[field] = max(0, int(str(settings.get(field) or "0").strip()))
+        except ValueError:
+            raise ValueError(f"{field} must be a whole number")
+    return policy if any(policy.values()) else {}
+
+def expired_snapshots(history, policy):
+    # history is newest first. The newest good snapshot is always kept, and an unfinished
+    # one newer than it is kept for the next run to resume.
+    good = [s for s in history if s["status"] == "Success"]
+    keep = {s["id"] for s in good[:max(1, policy.get("Keep Last", 0))]}
+    for field, period_format in RETENTION_PERIODS.items():
+        periods = set()
+        for s in good:
+            if len(periods) >= policy.get(field, 0):
+                break
+            period = datetime.strptime(s["created"], TIME_FORMAT).strftime(period_format)
+            if period not in periods:
+                periods.add(period)
+                keep.add(s["id"])
+    newest = good[0]["created"] if good else ""
+    return [s for s in history if s["id"] not in keep and (s["status"] == "Success" or s["created"] < newest)]
+
+def prune(task_name, destination, policy):
+    # Works from the catalog index alone; the destination tree is never scanned
+    if not policy:
+        return 0
+    removed = []
+    for s in expired_snapshots(catalog.get_snapshots(task_name, destination), policy):
+        if os.path.dirname(os.path.normpath(s["path"])) != os.path.normpath(destination):
+            log_message(f"Snapshot '{s['path']}' is outside '{destination}', leaving it on disk")
+        else:
+            try:
+                shutil.rmtree(s["path"])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log_message(f"Error removing snapshot '{s['path']}': {e}")
+                continue
+        removed.append(s["id"])
+    catalog.delete_snapshots(removed)
+    return len(removed)
+
+def prune_schedule(schedule, tasks):
+    try:
+        policy = retention_policy(schedule)
+        if not policy:
+            return
+        for task_name, destination in dict.fromkeys((t["task_name"], t["backup"]) for t in tasks):
+            removed = prune(task_name, destination, policy)
+            if removed:
+                log_message(f"Pruned {removed} snapshots of {task_name} in '{destination}'")
+    except Exception as e:
+        log_message(f"Error pruning snapshots for schedule '{schedule['Schedule Name']}': {e}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List and prune timestamped snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="List indexed snapshots, newest first")
+    list_cmd.add_argument("--task")
+    prune_cmd = sub.add_parser("prune", help="Remove snapshots a retention policy no longer keeps")
+    prune_cmd.add_argument("--schedule", help="Use the retention policy and tasks of this schedule")
+    prune_cmd.add_argument("--task", action="append", default=[], help="Prune this task (with --keep-*)")
+    for field in RETENTION_FIELDS:
+        prune_cmd.add_argument("--" + field.lower().replace(" ", "-"), type=int, default=0, dest=field)
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for s in catalog.get_snapshots(args.task):
+            print(f"{s['created']}  {s['task_name']}  {s['status']:<8}  {s['path']}")
+        return
+    if args.schedule:
+        schedule = catalog.get_schedule(args.schedule)
+        if schedule is None:
+            parser.error(f"No schedule named '{args.schedule}'")
+        policy = retention_policy(schedule)
+        names = [n.strip() for n in schedule.get("Selected Tasks", "").split(",") if n.strip()]
+    else:
+        policy = retention_policy(vars(args))
+        names = args.task
+    if not policy or not names:
+        parser.error("Nothing to prune: give a schedule with a retention policy, or --task with --keep-*")
+    for task_name, destination in dict.fromkeys((t["task_name"], t["backup"]) for t in catalog.get_tasks(names)):
+        print(f"{task_name} in {destination}: removed {prune(task_name, destination, policy)} snapshots")
+
+if __name__ == "__main__":
+    main()
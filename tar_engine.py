@@ -0,0 +1,325 @@
+import argparse
+import glob
+import gzip
+import io
+import lzma
+import os
+import stat
+import tarfile
+import time
+from functools import lru_cache
+
+from logger import log_message
+from metrics import current as current_metrics
+from throttle import current as current_throttle
+
+EXTENSIONS = {"zstd": ".tar.zst", "gzip": ".tar.gz", "xz": ".tar.xz", "none": ".tar"}
+ALIASES = {"zst": "zstd", "gz": "gzip", "lzma": "xz", "store": "none"}
+DEFAULT_LEVELS = {"zstd": 3, "gzip": 6, "xz": 6}
+READ_CHUNK = 1024 * 1024
+
+
+def zstd_module():
+    # The stdlib has zstd from Python 3.14; older versions can use the zstandard package
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+def tar_settings(compression=None, level=None, workers=1, volume_size=0):
+    compression = (compression or "").strip().lower()
+    compression = ALIASES.get(compression, compression) or ("zstd" if zstd_module() else "gzip")
+    if compression not in EXTENSIONS:
+        raise ValueError(f"Unknown tar compression '{compression}'")
+    if compression == "zstd" and zstd_module() is None:
+        log_message("zstd needs Python 3.14 or the zstandard package, using gzip")
+        compression = "gzip"
+    return {
+        "compression": compression,
+        "level": level if level is not None else DEFAULT_LEVELS.get(compression),
+        "workers": max(1, workers),
+        "volume_size": max(0, volume_size),
+    }
+
+def tar_path_for(src, dst, settings):
+    return os.path.join(dst, os.path.basename(os.path.normpath(src)) + EXTENSIONS[settings["compression"]])
+
+def archive_volumes(archive_path):
+    # The files holding an archive: archive_path itself, or archive_path.001, .002, ...
+    if os.path.exists(archive_path):
+        return [archive_path]
+    return sorted(glob.glob(glob.escape(archive_path) + ".[0-9][0-9][0-9]"))
+
+
+class VolumeWriter(io.RawIOBase):
+    # Write-only stream cut into volume_size pieces named <path>.001, .002, ... (a single
+    # <path> when volume_size is 0). Pieces are written as .partial until commit().
+
+    def __init__(self, path, volume_size=0):
+        super().__init__()
+        self.path = path
+        self.volume_size = volume_size
+        self.names = []
+        self.f = None
+        self.written = 0
+        self.next_volume()
+
+    def next_volume(self):
+        if self.f is not None:
+            self.f.close()
+        name = f"{self.path}.{len(self.names) + 1:03d}" if self.volume_size else self.path
+        self.names.append(name)
+        self.f = open(name + ".partial", "wb")
+        self.written = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        view = memoryview(data).cast("B")
+        total = len(view)
+        while view:
+            if self.volume_size and self.written >= self.volume_size:
+                self.next_volume()
+            n = len(view) if not self.volume_size else min(len(view), self.volume_size - self.written)
+            self.f.write(view[:n])
+            self.written += n
+            view = view[n:]
+        return total
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        super().close()
+
+    def commit(self):
+        # Replaces the previous archive, including volumes it had beyond this one's count
+        old = set(glob.glob(glob.escape(self.path) + ".[0-9][0-9][0-9]"))
+        if os.path.exists(self.path):
+            old.add(self.path)
+        for name in self.names:
+            os.replace(name + ".partial", name)
+        for name in old - set(self.names):
+            os.remove(name)
+        return list(self.names)
+
+    def discard(self):
+        self.close()
+        for name in self.names:
+            if os.path.exists(name + ".partial"):
+                os.remove(name + ".partial")
+
+
+class VolumeReader(io.RawIOBase):
+    # The volumes of an archive read back as one stream
+
+    def __init__(self, paths):
+        super().__init__()
+        self.paths = list(paths)
+        self.f = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.f is None:
+                if not self.paths:
+                    return 0
+                self.f = open(self.paths.pop(0), "rb")
+            n = self.f.readinto(buffer)
+            if n:
+                return n
+            self.f.close()
+            self.f = None
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        super().close()
+
+class PaddedReader:
+    # Reads exactly size bytes for a tar member. A file that shrinks or fails to read
+    # part-way is padded with zeros: a stream tar cannot take back a header already
+    # written, so the member is completed and the error recorded instead.
+
+    def __init__(self, f, size):
+        self.f = f
+        self.left = size
+        self.error = None
+
+    def read(self, n=-1):
+        n = self.left if n < 0 else min(n, self.left)
+        data = b""
+        if self.error is None:
+            try:
+                data = self.f.read(n)
+            except OSError as e:
+                self.error = str(e)
+            else:
+                if len(data) < n:
+                    self.error = f"file shrank while being archived, {self.left - len(data)} bytes zero-filled"
+        if len(data) < n:
+            data += bytes(n - len(data))
+        self.left -= n
+        return data
+
+def open_compressor(out, settings):
+    # A writable stream compressing into out (None for an uncompressed tar). Only zstd
+    # compresses on several threads; gzip and xz from the stdlib use one.
+    compression, level, workers = settings["compression"], settings["level"], settings["workers"]
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=out, mode="wb", compresslevel=level)
+    if compression == "xz":
+        return lzma.LZMAFile(out, "wb", preset=level)
+    if compression == "none":
+        return None
+    zstd = zstd_module()
+    threads = workers if workers > 1 else 0
+    if zstd.__name__ == "zstandard":
+        return zstd.ZstdCompressor(level=level, threads=threads, write_checksum=True).stream_writer(out, closefd=False)
+    options = {zstd.CompressionParameter.compression_level: level, zstd.CompressionParameter.checksum_flag: 1}
+    if threads:
+        options[zstd.CompressionParameter.nb_workers] = threads
+    return zstd.ZstdFile(out, "wb", options=options)
+
+def open_decompressor(raw, archive_path):
+    if archive_path.endswith(EXTENSIONS["gzip"]):
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if archive_path.endswith(EXTENSIONS["xz"]):
+        return lzma.LZMAFile(raw, "rb")
+    if archive_path.endswith(EXTENSIONS["zstd"]):
+        zstd = zstd_module()
+        if zstd is None:
+            raise ValueError("Reading .tar.zst needs Python 3.14 or the zstandard package")
+        if zstd.__name__ == "zstandard":
+            return zstd.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        return zstd.ZstdFile(raw, "rb")
+    return raw
+
+@lru_cache(maxsize=None)
+def owner_names(uid, gid):
+    # tarfile.gettarinfo looks these up for every file; once per owner is enough
+    try:
+        import pwd
+        import grp
+        return pwd.getpwuid(uid)[0], grp.getgrgid(gid)[0]
+    except (ImportError, KeyError):
+        return "", ""
+
+def tar_info(arcname, st):
+    info = tarfile.TarInfo(arcname)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.mtime = st.st_mtime
+    info.uid, info.gid = st.st_uid, st.st_gid
+    info.uname, info.gname = owner_names(st.st_uid, st.st_gid)
+    if stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    else:
+        info.size = st.st_size
+    return info
+
+def entry_size(entry):
+    return entry.stat.st_size if entry.stat else 0
+
+def write_tar(entries, archive_path, settings=None):
+    # entries: WalkEntry items from the tree walker. The tar is streamed through the
+    # compressor into the volumes, so memory stays bounded whatever the tree size.
+    # Returns (volume paths, [(path, error)] for files that could not be read).
+    settings = settings or tar_settings()
+    metrics = current_metrics()
+    errors = []
+    out = VolumeWriter(archive_path, settings["volume_size"])
+    try:
+        compressor = open_compressor(out, settings)
+        with tarfile.open(fileobj=compressor or out, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            for entry in current_throttle().limit(entries, entry_size):
+                start = time.perf_counter()
+                if entry.is_dir:
+                    try:
+                        tar.addfile(tar_info(entry.rel_path, os.stat(entry.path)))
+                    except OSError as e:
+                        errors.append((entry.path, str(e)))
+                    continue
+                try:
+                    f = open(entry.path, "rb")
+                except OSError as e:
+                    errors.append((entry.path, str(e)))
+                    continue
+                with f:
+                    # The size comes from the open file, so a file growing meanwhile stays consistent
+                    info = tar_info(entry.rel_path, os.fstat(f.fileno()))
+                    reader = PaddedReader(f, info.size)
+                    tar.addfile(info, reader)
+                if reader.error:
+                    errors.append((entry.path, reader.error))
+                    continue
+                metrics.file_done(entry.path, time.perf_counter() - start, "compress")
+                metrics.count(1, info.size)
+        with metrics.phase("write"):
+            if compressor is not None:
+                compressor.close()
+            out.close()
+            return out.commit(), errors
+    except BaseException:
+        out.discard()
+        raise
+
+def verify_tar(archive_path):
+    # Reads the whole archive back; gzip, xz and zstd each check their own checksum
+    volumes = archive_volumes(archive_path)
+    if not volumes:
+        return 0, [f"{os.path.basename(archive_path)}: archive not found"]
+    members = 0
+    try:
+        with io.BufferedReader(VolumeReader(volumes), READ_CHUNK) as raw:
+            stream = open_decompressor(raw, archive_path)
+            with tarfile.open(fileobj=stream, mode="r|") as tar:
+                for info in tar:
+                    if info.isfile():
+                        f = tar.extractfile(info)
+                        while f.read(READ_CHUNK):
+                            pass
+                    members += 1
+            # tarfile stops at the end-of-archive blocks; the compressor's checksum is only
+            # checked once its stream is read to the end
+            while stream.read(READ_CHUNK):
+                pass
+    except Exception as e:
+        # Each compressor raises its own error type for corrupt input
+        return members, [f"{os.path.basename(archive_path)}: unreadable after {members} members: {e}"]
+    return members, []
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List or extract tar backups, split or not")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="List the members of an archive")
+    list_cmd.add_argument("archive", help="Archive path without the .001 volume suffix")
+    extract_cmd = sub.add_parser("extract", help="Extract an archive into a folder")
+    extract_cmd.add_argument("archive", help="Archive path without the .001 volume suffix")
+    extract_cmd.add_argument("target")
+    args = parser.parse_args(argv)
+
+    volumes = archive_volumes(args.archive)
+    if not volumes:
+        parser.error(f"No archive at '{args.archive}'")
+    with io.BufferedReader(VolumeReader(volumes), READ_CHUNK) as raw:
+        with tarfile.open(fileobj=open_decompressor(raw, args.archive), mode="r|") as tar:
+            if args.command == "list":
+                for info in tar:
+                    print(f"{info.size:>12}  {info.name}{'/' if info.isdir() else ''}")
+            elif hasattr(tarfile, "data_filter"):
+                tar.extractall(args.target, filter="data")
+            else:
+                tar.extractall(args.target)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+import logger
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    # Keeps tests away from debug.txt and the catalog and CSV files next to the scripts
+    logger.set_log_file(str(tmp_path / "debug.txt"))
+    monkeypatch.setattr(catalog, "CATALOG_DB", str(tmp_path / "catalog.db"))
+    for name in ("PATHS_CSV", "SCHEDULE_CSV", "LOG_CSV"):
+        monkeypatch.setattr(catalog, name, str(tmp_path / "missing.csv"))
+    yield
+    logger.flush_logs()
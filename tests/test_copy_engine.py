@@ -0,0 +1,35 @@
+import errno
+import os
+
+import pytest
+
+import copy_engine
+from copy_engine import copy_file
+
+
+def test_kernel_copy_that_moves_nothing_falls_back_to_copy2(tmp_path, monkeypatch):
+    if "copy_file_range" not in copy_engine.KERNEL_METHODS:
+        pytest.skip("no copy_file_range here")
+    monkeypatch.setattr(copy_engine.os, "copy_file_range", lambda *args: 0)
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"x" * 5000)
+    dst = tmp_path / "dst.bin"
+    assert copy_file(str(src), str(dst), "copy_file_range") == "copy2"
+    assert dst.read_bytes() == src.read_bytes()
+
+
+def test_kernel_copy_that_stops_part_way_fails(tmp_path, monkeypatch):
+    if "sendfile" not in copy_engine.KERNEL_METHODS:
+        pytest.skip("no sendfile here")
+    calls = []
+    sendfile = os.sendfile
+
+    def short_sendfile(out_fd, in_fd, offset, count):
+        calls.append(offset)
+        return 0 if calls[1:] else sendfile(out_fd, in_fd, offset, 1000)
+    monkeypatch.setattr(copy_engine.os, "sendfile", short_sendfile)
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"x" * 5000)
+    with pytest.raises(OSError) as raised:
+        copy_file(str(src), str(tmp_path / "dst.bin"), "sendfile")
+    assert raised.value.errno == errno.EIO
@@ -0,0 +1,45 @@
+import pytest
+
+from dedup_store import dedup_backup, list_snapshots, restore_snapshot
+
+
+def test_snapshots_of_other_tasks_are_not_listed(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_text("a")
+    dst = str(tmp_path / "dst")
+    assert dedup_backup(str(src), dst, "A-B")[0]
+    assert list_snapshots(dst, "A") == []
+    assert len(list_snapshots(dst, "A-B")) == 1
+
+
+def test_runs_in_the_same_second_keep_their_own_snapshot(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    dst = str(tmp_path / "dst")
+    for i in range(3):
+        (src / "a.txt").write_text(f"version {i}")
+        assert dedup_backup(str(src), dst, "A")[0]
+    names = list_snapshots(dst, "A")
+    assert len(names) == 3
+    target = tmp_path / "restored"
+    assert restore_snapshot(dst, "A", str(target))[0] == names[-1]
+    assert (target / "a.txt").read_text() == "version 2"
+
+
+def test_rows_sharing_a_store_restore_their_own_source(tmp_path):
+    a, b, dst = tmp_path / "a", tmp_path / "b", str(tmp_path / "dst")
+    a.mkdir()
+    b.mkdir()
+    (a / "from_a.txt").write_text("a")
+    (b / "from_b.txt").write_text("b")
+    assert dedup_backup(str(a), dst, "T")[0]
+    assert dedup_backup(str(b), dst, "T")[0]
+    assert "1 unchanged" in dedup_backup(str(a), dst, "T")[1]
+    assert len(list_snapshots(dst, "T", str(a))) == 2
+    assert len(list_snapshots(dst, "T")) == 3
+    target = tmp_path / "restored"
+    restore_snapshot(dst, "T", str(target), src=str(b))
+    assert sorted(p.name for p in target.iterdir()) == ["from_b.txt"]
+    with pytest.raises(ValueError):
+        restore_snapshot(dst, "T", str(tmp_path / "other"))
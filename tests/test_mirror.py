@@ -0,0 +1,50 @@
+import errno
+import os
+
+import mirror
+from manifest import load_manifest, manifest_path
+from mirror import mirror_folder
+
+
+def make_tree(root, files):
+    for rel_path, text in files.items():
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+
+def test_unreadable_source_folder_deletes_nothing(tmp_path, monkeypatch):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    make_tree(src, {"a.txt": "a", "locked/b.txt": "b", "old.txt": "old"})
+    assert mirror_folder(str(src), str(dst), "M")[0]
+    os.remove(src / "old.txt")
+    scandir = os.scandir
+
+    def fake_scandir(folder):
+        if os.path.abspath(folder) == str(src / "locked"):
+            raise PermissionError(errno.EACCES, "Permission denied", folder)
+        return scandir(folder)
+    monkeypatch.setattr(os, "scandir", fake_scandir)
+    status, msg = mirror_folder(str(src), str(dst), "M")
+    assert not status
+    assert "unreadable" in msg
+    assert (dst / "locked" / "b.txt").exists()
+    assert (dst / "old.txt").exists()
+    assert {"locked/b.txt", "old.txt"} <= set(load_manifest(manifest_path(str(dst), "M")))
+
+    monkeypatch.setattr(os, "scandir", scandir)
+    assert mirror_folder(str(src), str(dst), "M")[0]
+    assert not (dst / "old.txt").exists()
+    assert (dst / "locked" / "b.txt").exists()
+
+
+def test_first_run_moves_unknown_files_to_trash(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    make_tree(src, {"a.txt": "a"})
+    make_tree(dst, {"other_task.zip": "zip", "a.txt": "older a"})
+    status, msg = mirror_folder(str(src), str(dst), "M")
+    assert status
+    assert not (dst / "other_task.zip").exists()
+    trashed = [os.path.join(root, name) for root, _, names in os.walk(dst / mirror.FIRST_RUN_TRASH) for name in names]
+    assert sorted(os.path.basename(p) for p in trashed) == ["a.txt", "other_task.zip"]
+    assert (dst / "a.txt").read_text() == "a"
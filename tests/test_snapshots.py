@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+import BackupProcess
+import catalog
+
+
+@pytest.fixture
+def task(tmp_path, monkeypatch):
+    monkeypatch.setattr(BackupProcess, "LOG_CSV", str(tmp_path / "backup_log.csv"))
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_text("first")
+    (src / "b.txt").write_text("same")
+    t = {"task_name": "T", "source": str(src), "backup": str(tmp_path / "dst"), "BackupType": "Incremental",
+         "Snapshots": "yes", "Hash": "yes"}
+    os.makedirs(t["backup"])
+    return t
+
+
+def last_message():
+    return catalog.get_runs("T", limit=1)[0]["message"]
+
+
+def test_touched_file_does_not_change_earlier_snapshots(task):
+    assert BackupProcess.run_task(task)
+    first = catalog.get_snapshots("T")[0]["path"]
+    old = os.stat(os.path.join(first, "b.txt")).st_mtime_ns
+    b_path = os.path.join(task["source"], "b.txt")
+    os.utime(b_path, ns=(old + 10 ** 9, old + 10 ** 9))
+    assert BackupProcess.run_task(task)
+    second = catalog.get_snapshots("T")[0]["path"]
+    assert second != first
+    assert os.stat(os.path.join(first, "b.txt")).st_mtime_ns == old
+    assert os.stat(os.path.join(second, "b.txt")).st_mtime_ns == old + 10 ** 9
+
+
+def test_resumed_snapshot_keeps_what_the_interrupted_run_copied(task):
+    assert BackupProcess.run_task(task)
+    with open(os.path.join(task["source"], "a.txt"), "w") as f:
+        f.write("second")
+    assert BackupProcess.run_task(task)
+    # Pretend the second run was interrupted after copying everything
+    unfinished = catalog.get_snapshots("T")[0]
+    catalog.set_snapshot_status(unfinished["id"], "Failed")
+    assert BackupProcess.run_task(task)
+    assert catalog.get_snapshots("T")[0]["path"] == unfinished["path"]
+    assert last_message().startswith("Copied 0 files")
+    with open(os.path.join(unfinished["path"], "a.txt")) as f:
+        assert f.read() == "second"
+
+
+def test_backupctl_verify_checks_the_newest_snapshot(task, capsys):
+    import backupctl
+    catalog.save_task_entries("T", [task])
+    assert backupctl.verify_tasks(["T"]) == 1
+    assert BackupProcess.run_task(task)
+    assert backupctl.verify_tasks(["T"]) == 0
+    newest = catalog.get_snapshots("T")[0]["path"]
+    os.remove(os.path.join(newest, "a.txt"))
+    assert backupctl.verify_tasks(["T"]) == 1
+    assert catalog.get_runs("T", limit=1)[0]["destination"] == newest
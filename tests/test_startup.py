@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+from benchmark import STARTUP_BUDGET_MS, STARTUP_MODULES
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_ms():
+    # Cumulative -X importtime of the startup modules, in milliseconds
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(STARTUP_MODULES)}"],
+                         cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    total = 0
+    for line in out.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() in STARTUP_MODULES and not fields[2].startswith("  "):
+            total += int(fields[1]) / 1000
+    return total
+
+
+def test_startup_imports_stay_within_budget():
+    # Best of three, so a busy machine does not fail the check
+    best = min(import_ms() for _ in range(3))
+    assert 0 < best < STARTUP_BUDGET_MS
+
+
+def test_startup_does_not_import_engines():
+    modules = ["catalog", "copy_engine", "concurrent.futures", "csv", "sqlite3", "metrics", "throttle"]
+    code = (f"import sys, {', '.join(STARTUP_MODULES)}; "
+            f"print(' '.join(m for m in {modules!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == []
@@ -0,0 +1,29 @@
+import os
+import tarfile
+
+import tar_engine
+from tar_engine import tar_settings, verify_tar, write_tar
+from tree_walker import walk_tree
+
+
+def test_file_shrinking_while_archived_keeps_the_archive(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"a" * 5000)
+    (src / "b.txt").write_bytes(b"b" * 100)
+    real_read = tar_engine.PaddedReader.read
+
+    def shrinking_read(self, n=-1):
+        # a.txt is cut to 1000 bytes after its size went into the member header
+        if self.f.name.endswith("a.txt"):
+            os.truncate(self.f.name, 1000)
+        return real_read(self, n)
+    monkeypatch.setattr(tar_engine.PaddedReader, "read", shrinking_read)
+
+    archive = str(tmp_path / "out.tar.gz")
+    volumes, errors = write_tar(walk_tree(str(src), dirs=True), archive, tar_settings("gzip"))
+    assert [path for path, _ in errors] == [str(src / "a.txt")]
+    assert verify_tar(archive) == (2, [])
+    with tarfile.open(archive) as tar:
+        assert tar.extractfile("b.txt").read() == b"b" * 100
+        assert len(tar.extractfile("a.txt").read()) == 5000
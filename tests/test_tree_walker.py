@@ -0,0 +1,45 @@
+import errno
+import os
+
+import pytest
+
+import tree_walker
+from tree_walker import walk_tree
+
+
+def unreadable(monkeypatch, path):
+    scandir = os.scandir
+
+    def fake_scandir(folder):
+        if os.path.abspath(folder) == os.path.abspath(path):
+            raise PermissionError(errno.EACCES, "Permission denied", folder)
+        return scandir(folder)
+    monkeypatch.setattr(tree_walker.os, "scandir", fake_scandir)
+
+
+def test_unreadable_folder_raises_by_default(tmp_path, monkeypatch):
+    (tmp_path / "locked").mkdir()
+    (tmp_path / "a.txt").write_text("a")
+    unreadable(monkeypatch, tmp_path / "locked")
+    with pytest.raises(PermissionError):
+        list(walk_tree(str(tmp_path)))
+
+
+def test_unreadable_folder_goes_to_onerror(tmp_path, monkeypatch):
+    (tmp_path / "locked").mkdir()
+    (tmp_path / "a.txt").write_text("a")
+    unreadable(monkeypatch, tmp_path / "locked")
+    errors = []
+    assert [e.rel_path for e in walk_tree(str(tmp_path), onerror=errors.append)] == ["a.txt"]
+    assert len(errors) == 1
+
+
+def test_symlinked_folders_are_followed_without_looping(tmp_path):
+    (tmp_path / "real").mkdir()
+    (tmp_path / "real" / "f.txt").write_text("f")
+    os.symlink(tmp_path / "real", tmp_path / "link")
+    os.symlink(tmp_path, tmp_path / "real" / "loop")
+    errors = []
+    found = {e.rel_path for e in walk_tree(str(tmp_path), onerror=errors.append)}
+    assert found == {"real/f.txt", "link/f.txt"}
+    assert [e.errno for e in errors] == [errno.ELOOP, errno.ELOOP]
@@ -0,0 +1,33 @@
+import zipfile
+
+from zip_chain import differential_zip, load_chain, restore_chain
+
+
+def test_rows_sharing_a_destination_keep_their_own_chains(tmp_path):
+    a, b, dst = tmp_path / "a", tmp_path / "b", str(tmp_path / "dst")
+    a.mkdir()
+    b.mkdir()
+    (a / "from_a.txt").write_text("a")
+    (b / "from_b.txt").write_text("b")
+    for _ in range(2):
+        assert differential_zip(str(a), dst, "T")[0]
+        assert differential_zip(str(b), dst, "T")[0]
+    chain_b = load_chain(dst, "T", str(b))
+    assert [e["kind"] for e in chain_b] == ["full", "diff"]
+    assert chain_b[-1]["deleted"] == []
+    target = tmp_path / "restored"
+    restore_chain(dst, chain_b, str(target))
+    assert sorted(p.name for p in target.iterdir()) == ["from_b.txt"]
+
+
+def test_archives_made_in_the_same_second_do_not_overwrite_each_other(tmp_path):
+    src, dst = tmp_path / "src", str(tmp_path / "dst")
+    src.mkdir()
+    (src / "f.txt").write_text("f")
+    for _ in range(3):
+        assert differential_zip(str(src), dst, "T", full_every=1)[0]
+    names = [e["archive"] for e in load_chain(dst, "T", str(src))]
+    assert len(set(names)) == 3
+    for name in names:
+        with zipfile.ZipFile(f"{dst}/{name}") as zipf:
+            assert zipf.namelist() == ["f.txt"]
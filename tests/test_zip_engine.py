@@ -0,0 +1,42 @@
+import os
+import zipfile
+
+import pytest
+
+import zip_engine
+from zip_engine import write_zip, zip_settings
+
+
+def make_members(folder):
+    members = []
+    for i, size in enumerate((0, 10, 100 * 1024, zip_engine.SPOOL_THRESHOLD + 1)):
+        path = folder / f"file{i}.txt"
+        path.write_bytes(b"backup data %d\n" % i * (size // 14) + os.urandom(size % 14))
+        members.append((str(path), path.name, None))
+    return members
+
+
+@pytest.mark.parametrize("compression", ["deflate", "bzip2", "lzma", "store"])
+def test_parallel_zip_round_trip(tmp_path, compression):
+    src = tmp_path / "src"
+    src.mkdir()
+    members = make_members(src)
+    zip_path = str(tmp_path / "out.zip")
+    write_zip(members, zip_path, workers=2, settings=zip_settings(compression))
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.testzip() is None
+        for full_path, arcname, _ in members:
+            with open(full_path, "rb") as f:
+                assert zipf.read(arcname) == f.read()
+
+
+def test_parallel_zip_falls_back_to_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(zip_engine, "PRECOMPRESSED_VERSIONS", ((2, 0), (2, 7)))
+    src = tmp_path / "src"
+    src.mkdir()
+    members = make_members(src)
+    zip_path = str(tmp_path / "out.zip")
+    write_zip(members, zip_path, workers=2)
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.testzip() is None
+        assert sorted(zipf.namelist()) == sorted(m[1] for m in members)
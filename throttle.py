@@ -0,0 +1,190 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+BURST_SECONDS = 1.0     # a bucket holds at most this many seconds of its rate
+MAX_SLEEP = 1.0         # re-read the rate at least this often, so profile changes apply mid-file-list
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2, "G": 1024 ** 3, "GB": 1024 ** 3}
+PRIORITIES = ("normal", "low", "idle")
+PRIO_DARWIN_PROCESS = 4         # macOS setpriority() target and value for the background state
+PRIO_DARWIN_BG = 0x1000
+
+_schedule_throttles = {}
+_schedule_lock = threading.Lock()
+_background_users = 0
+_background_lock = threading.Lock()
+
+
+def parse_size(text):
+    # "20MB", "512K", "1.5G" or a plain number of bytes; empty or 0 means unlimited
+    text = str(text or "").strip()
+    number = text.upper().rstrip("KMGB")
+    unit = text[len(number):].upper()
+    if not number or unit not in SIZE_UNITS:
+        return 0
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Bad size '{text}', expected a number of bytes such as 20MB or 512K")
+
+def parse_profiles(text):
+    # "08:00-18:00 20MB 200; 18:00-08:00 0 0" -> [(start_min, end_min, bytes/s, files/s)]
+    profiles = []
+    for part in str(text or "").split(";"):
+        fields = part.split()
+        if not fields:
+            continue
+        start, _, end = fields[0].partition("-")
+        try:
+            start_h, start_m = (int(v) for v in start.split(":"))
+            end_h, end_m = (int(v) for v in end.split(":"))
+        except ValueError:
+            raise ValueError(f"Bad throttle profile '{part.strip()}', expected HH:MM-HH:MM bytes files")
+        byte_rate = parse_size(fields[1]) if len(fields) > 1 else 0
+        file_rate = parse_size(fields[2]) if len(fields) > 2 else 0
+        profiles.append((start_h * 60 + start_m, end_h * 60 + end_m, byte_rate, file_rate))
+    return profiles
+
+def profile_rates(profiles, default, now=None):
+    # The first profile whose window holds now wins; windows may wrap past midnight
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    for start, end, byte_rate, file_rate in profiles:
+        if start <= minute < end or (end < start and (minute >= start or minute < end)):
+            return byte_rate, file_rate
+    return default
+
+
+class TokenBucket:
+    # rate is units per second (0 = unlimited) or a callable returning it. A take larger
+    # than the bucket goes into debt, so one huge file still passes but the next one waits.
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def current_rate(self):
+        return self.rate() if callable(self.rate) else self.rate
+
+    def take(self, amount):
+        while True:
+            with self.lock:
+                rate = self.current_rate()
+                now = time.monotonic()
+                if not rate:
+                    self.tokens = 0.0
+                    self.stamp = now
+                    return
+                self.tokens = min(self.tokens + (now - self.stamp) * rate, rate * BURST_SECONDS)
+                self.stamp = now
+                if self.tokens >= 0:
+                    self.tokens -= amount
+                    return
+                wait = -self.tokens / rate
+            time.sleep(min(wait, MAX_SLEEP))
+
+
+class Throttle:
+    # Limits for one task run: its own buckets plus the shared ones of its schedule
+
+    def __init__(self, byte_buckets=(), file_buckets=(), metrics=None):
+        self.byte_buckets = [b for b in byte_buckets if b is not None]
+        self.file_buckets = [b for b in file_buckets if b is not None]
+        self.metrics = metrics
+
+    def for_task(self, task, metrics=None):
+        byte_rate = parse_size(task.get("MaxBytesPerSec"))
+        file_rate = parse_size(task.get("MaxFilesPerSec"))
+        return Throttle(self.byte_buckets + [TokenBucket(byte_rate) if byte_rate else None],
+                        self.file_buckets + [TokenBucket(file_rate) if file_rate else None], metrics)
+
+    def consume(self, nbytes, files=1):
+        if not self.byte_buckets and not self.file_buckets:
+            return
+        start = time.perf_counter()
+        for bucket in self.file_buckets:
+            bucket.take(files)
+        for bucket in self.byte_buckets:
+            bucket.take(nbytes)
+        if self.metrics is not None:
+            self.metrics.add_phase("throttle", time.perf_counter() - start)
+
+    def limit(self, items, size_of):
+        for item in items:
+            self.consume(size_of(item))
+            yield item
+
+UNLIMITED = Throttle()
+
+def schedule_throttle(schedule):
+    # One set of buckets per schedule name, shared by all of its concurrently running
+    # tasks and kept across runs in a long-lived scheduler
+    default = (parse_size(schedule.get("Max Bytes Per Sec")), parse_size(schedule.get("Max Files Per Sec")))
+    profiles = parse_profiles(schedule.get("Throttle Profiles"))
+    if not profiles and not any(default):
+        return UNLIMITED
+    with _schedule_lock:
+        buckets = _schedule_throttles.get(schedule["Schedule Name"])
+        if buckets is None:
+            buckets = (TokenBucket(None), TokenBucket(None))
+            _schedule_throttles[schedule["Schedule Name"]] = buckets
+    byte_bucket, file_bucket = buckets
+    byte_bucket.rate = lambda: profile_rates(profiles, default)[0]
+    file_bucket.rate = lambda: profile_rates(profiles, default)[1]
+    return Throttle([byte_bucket], [file_bucket])
+
+_local = threading.local()
+
+def start_task(throttle):
+    _local.throttle = throttle
+    return throttle
+
+def current():
+    return getattr(_local, "throttle", None) or UNLIMITED
+
+def _no_restore():
+    pass
+
+def _set_background(step):
+    # Windows and macOS only have a process-wide background mode: the first lowered
+    # schedule enters it and the last one to finish leaves it, so a long-lived scheduler
+    # goes back to normal priority between runs
+    global _background_users
+    with _background_lock:
+        _background_users += step
+        if _background_users != (1 if step > 0 else 0):
+            return
+        if sys.platform == "win32":
+            import ctypes
+            # Background mode lowers CPU, I/O and memory priority together
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), 0x00100000 if step > 0 else 0x00200000)
+        else:
+            os.setpriority(PRIO_DARWIN_PROCESS, 0, PRIO_DARWIN_BG if step > 0 else 0)
+
+def lower_priority(level):
+    # Returns a function that undoes it. On Linux nice and ionice apply to the calling
+    # thread and the threads it starts afterwards, so each schedule can run at its own
+    # priority and nothing needs undoing once its thread ends.
+    level = str(level or "").strip().lower()
+    if level in ("", "normal"):
+        return _no_restore
+    if level not in PRIORITIES:
+        raise ValueError(f"Unknown IO priority '{level}'")
+    if sys.platform in ("win32", "darwin"):
+        _set_background(1)
+        return lambda: _set_background(-1)
+    os.nice(10 if level == "low" else 19)
+    if sys.platform.startswith("linux"):
+        import subprocess
+        ionice = ["-c", "2", "-n", "7"] if level == "low" else ["-c", "3"]
+        try:
+            subprocess.run(["ionice"] + ionice + ["-p", str(threading.get_native_id())], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    return _no_restore
@@ -0,0 +1,81 @@
+import errno
+import fnmatch
+import os
+from collections import namedtuple
+
+# rel_path always uses "/" separators; stat is None when the entry could not be stat'ed
+WalkEntry = namedtuple("WalkEntry", ["path", "rel_path", "is_dir", "stat"])
+
+
+def parse_patterns(text):
+    if not text:
+        return []
+    return [p.strip() for p in str(text).split(";") if p.strip()]
+
+def matches(rel_path, patterns):
+    name = rel_path.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        target = rel_path if "/" in pattern else name
+        if fnmatch.fnmatch(target, pattern):
+            return True
+    return False
+
+def raise_error(e):
+    raise e
+
+def dir_key(path, entry=None):
+    # Identity of a folder for loop detection; DirEntry.stat() has no inode on Windows
+    st = entry.stat() if entry is not None else os.stat(path)
+    if not st.st_ino:
+        st = os.stat(path)
+    return st.st_dev, st.st_ino
+
+def walk_tree(src, include=None, exclude=None, dirs=False, onerror=raise_error):
+    # Single scandir pass: directory entries come before their contents, and the
+    # stat of each file is taken once (free on Windows, one syscall elsewhere).
+    # A folder that cannot be read raises by default, as copytree did; pass onerror
+    # to collect those errors instead. Symlinked folders are followed like real ones,
+    # unless they point back at a folder the walk is already inside.
+    try:
+        stack = [(src, "", frozenset([dir_key(src)]))]
+    except OSError as e:
+        onerror(e)
+        return
+    while stack:
+        folder, rel_folder, parents = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = list(it)
+        except OSError as e:
+            onerror(e)
+            continue
+        subfolders = []
+        for entry in entries:
+            rel_path = f"{rel_folder}/{entry.name}" if rel_folder else entry.name
+            if exclude and matches(rel_path, exclude):
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                try:
+                    key = dir_key(entry.path, entry)
+                except OSError as e:
+                    onerror(e)
+                    continue
+                if key in parents:
+                    onerror(OSError(errno.ELOOP, "Symbolic link loop", entry.path))
+                    continue
+                if dirs:
+                    yield WalkEntry(entry.path, rel_path, True, None)
+                subfolders.append((entry.path, rel_path, parents | {key}))
+                continue
+            if include and not matches(rel_path, include):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                st = None
+            yield WalkEntry(entry.path, rel_path, False, st)
+        stack.extend(reversed(subfolders))
@@ -0,0 +1,77 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from manifest import file_hash, meta_path, safe_name
+from copy_engine import copy_files
+from tree_walker import walk_tree
+
+VERIFY_WORKERS = 4
+
+
+def checksums_path(dst, task_name):
+    return meta_path(dst, f"{safe_name(task_name)}.sha256")
+
+def write_checksums(path, checksums):
+    # sha256sum format, so `sha256sum -c` can re-check the backup from its folder
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        for name in sorted(checksums):
+            f.write(f"{checksums[name]}  {name}\n")
+    os.replace(tmp_path, path)
+
+def verify_tree(src, dst, hashes=None, workers=VERIFY_WORKERS, include=None, exclude=None):
+    # Hashes every copy and compares it with its source. Source hashes already taken
+    # during the copy (hashes: source path -> sha256) are reused instead of re-read.
+    # Returns ({rel_path: sha256 of the copy}, [problem], number of reused hashes)
+    hashes = hashes or {}
+    checksums = {}
+    problems = []
+    reused = 0
+
+    def jobs():
+        for item in walk_tree(src, include, exclude):
+            size = item.stat.st_size if item.stat else 0
+            yield item.path, os.path.join(dst, *item.rel_path.split("/")), size, item.rel_path
+
+    def check(s_path, d_path):
+        d_hash = file_hash(d_path)
+        known = hashes.get(s_path)
+        return d_hash, known, known or file_hash(s_path)
+
+    def on_checked(job, result):
+        nonlocal reused
+        d_hash, known, s_hash = result
+        if known:
+            reused += 1
+        checksums[job[3]] = d_hash
+        if d_hash != s_hash:
+            problems.append(f"{job[3]}: copy differs from source")
+
+    # copy_files is the bounded worker pool; here each job hashes instead of copying
+    checked, checked_bytes, errors = copy_files(jobs(), max(1, workers), check, on_checked)
+    problems.extend(f"{path}: {error}" for path, error in errors)
+    return checksums, problems, reused
+
+def _test_members(zip_path, names):
+    problems = []
+    with zipfile.ZipFile(zip_path) as zipf:
+        for name in names:
+            try:
+                # Reading to the end makes zipfile compare the member's CRC-32
+                with zipf.open(name) as member:
+                    while member.read(1024 * 1024):
+                        pass
+            except Exception as e:
+                problems.append(f"{name}: {e}")
+    return problems
+
+def verify_zip(zip_path, workers=VERIFY_WORKERS):
+    # testzip() spread over workers, each with its own handle on the archive
+    with zipfile.ZipFile(zip_path) as zipf:
+        names = [i.filename for i in zipf.infolist() if not i.is_dir()]
+    workers = max(1, min(workers, len(names)))
+    batches = [names[i::workers] for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        problems = [p for result in pool.map(lambda batch: _test_members(zip_path, batch), batches) for p in result]
+    return len(names), problems
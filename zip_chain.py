@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import re
+import zipfile
+from datetime import datetime
+
+from logger import log_message
+from manifest import META_DIR, meta_path, safe_name, source_id, load_manifest, save_manifest
+from metrics import current as current_metrics
+from tree_walker import walk_tree
+from zip_engine import write_zip
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_FULL_EVERY = 7
+
+
+# Each source of a task has its own chain: rows of one task can share a destination
+def chain_key(task_name, src):
+    return f"{safe_name(task_name)}.{source_id(src)}"
+
+def chain_index_path(dst, key):
+    return meta_path(dst, f"{key}.zipchain.json")
+
+def base_manifest_path(dst, key):
+    return meta_path(dst, f"{key}.zipbase.json")
+
+def find_chain_keys(dst, task_name):
+    # Chain keys of every source of a task in dst, for the command line
+    pattern = re.compile(re.escape(safe_name(task_name)) + r"\.[0-9a-f]{12}\.zipchain\.json")
+    folder = os.path.join(dst, META_DIR)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(n[:-len(".zipchain.json")] for n in os.listdir(folder) if pattern.fullmatch(n))
+
+def load_chain(dst, task_name, src):
+    path = chain_index_path(dst, chain_key(task_name, src))
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def load_chain_by_key(dst, key):
+    with open(chain_index_path(dst, key), encoding="utf-8") as f:
+        return json.load(f)
+
+def archive_name(dst, prefix, kind, stamp):
+    # A second archive within the same second gets a -2, -3, ... suffix
+    name = f"{prefix}-{kind}-{stamp:%Y%m%d-%H%M%S}"
+    suffix = 1
+    while os.path.exists(os.path.join(dst, f"{name}.zip")):
+        suffix += 1
+        name = f"{prefix}-{kind}-{stamp:%Y%m%d-%H%M%S}-{suffix}"
+    return name + ".zip"
+
+def scan_tree(src, include=None, exclude=None):
+    files = {}
+    for entry in walk_tree(src, include, exclude):
+        if entry.stat is None:
+            raise OSError(f"Cannot stat '{entry.path}'")
+        files[entry.rel_path] = {"size": entry.stat.st_size, "mtime": entry.stat.st_mtime_ns}
+    return files
+
+def differential_zip(src, dst, task_name, workers=1, settings=None, full_every=DEFAULT_FULL_EVERY,
+                     include=None, exclude=None):
+    try:
+        if not os.path.isdir(src):
+            log_message(f"Source path '{src}' is not a directory")
+            return False, f"Source path '{src}' is not a directory"
+        os.makedirs(dst, exist_ok=True)
+        key = chain_key(task_name, src)
+        chain = load_chain(dst, task_name, src)
+        bases = [e for e in chain if e["kind"] == "full"]
+        base = bases[-1] if bases else None
+        if base is not None:
+            diffs_since_base = sum(1 for e in chain if e.get("base") == base["archive"])
+            if diffs_since_base >= max(1, full_every) - 1 or \
+                    not os.path.exists(os.path.join(dst, base["archive"])):
+                base = None
+
+        with current_metrics().phase("scan"):
+            current = scan_tree(src, include, exclude)
+        stamp = datetime.now()
+        prefix = os.path.basename(os.path.normpath(src))
+        if base is None:
+            archive = archive_name(dst, prefix, "full", stamp)
+            changed = sorted(current)
+            deleted = []
+        else:
+            base_files = load_manifest(base_manifest_path(dst, key))
+            changed = sorted(p for p, entry in current.items() if base_files.get(p) != entry)
+            unchanged = set(current).difference(changed)
+            current_metrics().skip(len(unchanged), sum(current[p]["size"] for p in unchanged))
+            deleted = sorted(p for p in base_files if p not in current)
+            archive = archive_name(dst, prefix, "diff", stamp)
+
+        members = ((os.path.join(src, *p.split("/")), p, None) for p in changed)
+        write_zip(members, os.path.join(dst, archive), workers, settings)
+
+        entry = {"archive": archive, "time": stamp.strftime(TIME_FORMAT)}
+        if base is None:
+            save_manifest(base_manifest_path(dst, key), current)
+            entry["kind"] = "full"
+            msg = f"Full archive {archive} ({len(changed)} files)"
+        else:
+            entry.update(kind="diff", base=base["archive"], deleted=deleted)
+            msg = (f"Differential archive {archive} ({len(changed)} changed, "
+                   f"{len(deleted)} deleted since {base['archive']})")
+        chain.append(entry)
+        save_manifest(chain_index_path(dst, key), chain)
+        return True, msg
+    except Exception as e:
+        log_message(f"Error in differential_zip: {e}")
+        return False, str(e)
+
+def find_restore_point(chain, at=None):
+    points = [e for e in chain if at is None or e["time"] <= at.strftime(TIME_FORMAT)]
+    return points[-1] if points else None
+
+def restore_chain(dst, chain, target, at=None):
+    point = find_restore_point(chain, at)
+    if point is None:
+        raise ValueError(f"No archive in '{dst}' at or before {at or 'now'}")
+    os.makedirs(target, exist_ok=True)
+    if point["kind"] == "diff":
+        skip = set(point["deleted"])
+        with zipfile.ZipFile(os.path.join(dst, point["base"])) as zipf:
+            with zipfile.ZipFile(os.path.join(dst, point["archive"])) as diff:
+                skip.update(diff.namelist())
+            zipf.extractall(target, [n for n in zipf.namelist() if n not in skip])
+    with zipfile.ZipFile(os.path.join(dst, point["archive"])) as zipf:
+        zipf.extractall(target)
+    return point
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and restore differential zip backups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="List the archives of a task")
+    list_cmd.add_argument("dest")
+    list_cmd.add_argument("task")
+    list_cmd.add_argument("--source", help="Source folder, when the task has several in dest")
+    restore_cmd = sub.add_parser("restore", help="Rebuild a task's tree as of a point in time")
+    restore_cmd.add_argument("dest")
+    restore_cmd.add_argument("task")
+    restore_cmd.add_argument("target")
+    restore_cmd.add_argument("--at", help='Point in time, "YYYY-MM-DD HH:MM:SS" (default: latest)')
+    restore_cmd.add_argument("--source", help="Source folder, when the task has several in dest")
+    args = parser.parse_args()
+
+    if args.source:
+        chain = load_chain(args.dest, args.task, args.source)
+    else:
+        keys = find_chain_keys(args.dest, args.task)
+        if len(keys) > 1:
+            parser.error(f"'{args.task}' has archives of {len(keys)} sources in '{args.dest}', pass --source")
+        chain = load_chain_by_key(args.dest, keys[0]) if keys else []
+    if args.command == "list":
+        for e in chain:
+            extra = f" (base {e['base']}, {len(e['deleted'])} deleted)" if e["kind"] == "diff" else ""
+            print(f"{e['time']}  {e['kind']:<4}  {e['archive']}{extra}")
+    else:
+        at = datetime.strptime(args.at, TIME_FORMAT) if args.at else None
+        point = restore_chain(args.dest, chain, args.target, at)
+        print(f"Restored {args.task} as of {point['time']} into {args.target}")
+
+if __name__ == "__main__":
+    main()
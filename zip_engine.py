@@ -0,0 +1,260 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+
+from checkpoint import zipinfo_record, zip_resume_state
+from logger import log_message
+from metrics import current as current_metrics
+from throttle import current as current_throttle
+
+READ_CHUNK = 1024 * 1024
+# Compressed members larger than this go back to the writer through a temp file
+SPOOL_THRESHOLD = 4 * 1024 * 1024
+JOBS_PER_WORKER = 2
+# Python versions whose zipfile write handles write_compressed_member has been checked
+# against; other versions compress in the writer instead
+PRECOMPRESSED_VERSIONS = ((3, 8), (3, 14))
+ENTROPY_SAMPLE = 64 * 1024
+# A sample that deflates to more than this fraction of its size is stored as-is
+ENTROPY_STORE_RATIO = 0.95
+
+COMPRESSION_TYPES = {
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+    "store": zipfile.ZIP_STORED,
+}
+STORE_EXTENSIONS = {
+    ".zip", ".7z", ".rar", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".lz4", ".cab",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp3", ".m4a", ".aac", ".ogg", ".flac", ".mp4", ".m4v", ".mkv", ".avi", ".mov", ".wmv",
+    ".docx", ".xlsx", ".pptx", ".jar", ".whl", ".apk",
+}
+
+
+def zip_settings(compression="deflate", level=None, store_rule="extension", store_extensions=None):
+    compression = (compression or "deflate").strip().lower()
+    if compression not in COMPRESSION_TYPES:
+        raise ValueError(f"Unknown compression '{compression}'")
+    store_rule = (store_rule or "extension").strip().lower()
+    if store_rule not in ("none", "extension", "entropy", "both"):
+        raise ValueError(f"Unknown store rule '{store_rule}'")
+    if store_extensions:
+        extensions = {"." + e.strip().lower().lstrip(".") for e in store_extensions.split(",") if e.strip()}
+    else:
+        extensions = STORE_EXTENSIONS
+    return {
+        "type": COMPRESSION_TYPES[compression],
+        "level": level,
+        "store_extensions": extensions if store_rule in ("extension", "both") else set(),
+        "entropy": store_rule in ("entropy", "both"),
+    }
+
+def looks_incompressible(path):
+    with open(path, "rb") as f:
+        sample = f.read(ENTROPY_SAMPLE)
+    if len(sample) < 1024:
+        return False
+    return len(zlib.compress(sample, 1)) > len(sample) * ENTROPY_STORE_RATIO
+
+def member_compression(path, settings):
+    if settings["type"] == zipfile.ZIP_STORED:
+        return zipfile.ZIP_STORED
+    if os.path.splitext(path)[1].lower() in settings["store_extensions"]:
+        return zipfile.ZIP_STORED
+    if settings["entropy"] and looks_incompressible(path):
+        return zipfile.ZIP_STORED
+    return settings["type"]
+
+
+def compress_member(path, settings, spool_dir):
+    # Runs in a worker process; uses the same compressor zipfile would pick
+    compress_type = member_compression(path, settings)
+    compressor = zipfile._get_compressor(compress_type, settings["level"])
+    crc = file_size = compress_size = 0
+    parts = []
+    spool = None
+
+    def emit(data):
+        nonlocal compress_size, spool
+        if not data:
+            return
+        compress_size += len(data)
+        if spool is None and compress_size > SPOOL_THRESHOLD:
+            spool = tempfile.NamedTemporaryFile(dir=spool_dir, delete=False)
+            spool.write(b"".join(parts))
+            parts.clear()
+        if spool is not None:
+            spool.write(data)
+        else:
+            parts.append(data)
+
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                crc = zlib.crc32(chunk, crc)
+                file_size += len(chunk)
+                emit(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            emit(compressor.flush())
+    finally:
+        if spool is not None:
+            spool.close()
+    if spool is not None:
+        return compress_type, crc, file_size, compress_size, None, spool.name
+    return compress_type, crc, file_size, compress_size, b"".join(parts), None
+
+def timed_compress_member(path, settings, spool_dir):
+    start = time.perf_counter()
+    result = compress_member(path, settings, spool_dir)
+    return time.perf_counter() - start, result
+
+class Passthrough:
+    # Stands in for the compressor of a zipfile write handle: the data is already compressed
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b""
+
+def write_compressed_member(zipf, zinfo, result):
+    # zipfile has no public way to add compressed data, so the member goes through
+    # zipf.open(zinfo, "w") with its compressor swapped for a passthrough and the
+    # uncompressed size and CRC set before close. Only the versions in
+    # PRECOMPRESSED_VERSIONS are known to keep those write handle internals.
+    compress_type, crc, file_size, compress_size, data, spool_path = result
+    zinfo.compress_type = compress_type
+    zinfo.file_size = file_size
+    zip64 = file_size > zipfile.ZIP64_LIMIT or compress_size > zipfile.ZIP64_LIMIT
+    with zipf.open(zinfo, "w", force_zip64=zip64) as dest:
+        dest._compressor = Passthrough()
+        if spool_path:
+            with open(spool_path, "rb") as f:
+                shutil.copyfileobj(f, dest, READ_CHUNK)
+        else:
+            dest.write(data)
+        dest._crc = crc
+        dest._file_size = file_size
+    if spool_path:
+        os.remove(spool_path)
+
+def precompressed_writes():
+    low, high = PRECOMPRESSED_VERSIONS
+    return low <= sys.version_info[:2] <= high and hasattr(zipfile, "_ZipWriteFile")
+
+def member_info(full_path, arcname, st=None):
+    # Same as ZipInfo.from_file, but reuses a stat the tree walker already took
+    if st is None:
+        return zipfile.ZipInfo.from_file(full_path, arcname)
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.file_size = st.st_size
+    return zinfo
+
+def member_size(member):
+    full_path, arcname, st = member
+    if st is not None:
+        return st.st_size
+    try:
+        return os.path.getsize(full_path)
+    except OSError:
+        return 0
+
+def parallel_zip(members, zipf, workers, settings, spool_dir, on_member=None):
+    # members: iterable of (full_path, arcname, stat or None); archive order follows the iterable
+    from concurrent.futures import ProcessPoolExecutor  # pulls in multiprocessing; only parallel zips need it
+    metrics = current_metrics()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window = deque()
+
+        def write_next():
+            zinfo, future = window.popleft()
+            elapsed, result = future.result()
+            metrics.file_done(zinfo.filename, elapsed, "compress")
+            with metrics.phase("write"):
+                write_compressed_member(zipf, zinfo, result)
+            if on_member:
+                on_member(zinfo)
+
+        for full_path, arcname, st in members:
+            zinfo = member_info(full_path, arcname, st)
+            zinfo._compresslevel = settings["level"]
+            window.append((zinfo, pool.submit(timed_compress_member, full_path, settings, spool_dir)))
+            if len(window) >= workers * JOBS_PER_WORKER:
+                write_next()
+        while window:
+            write_next()
+
+def serial_zip(members, zipf, settings, on_member=None):
+    metrics = current_metrics()
+    for full_path, arcname, st in members:
+        start = time.perf_counter()
+        zinfo = member_info(full_path, arcname, st)
+        zinfo.compress_type = member_compression(full_path, settings)
+        zinfo._compresslevel = settings["level"]
+        with open(full_path, "rb") as src, zipf.open(zinfo, 'w') as dest:
+            shutil.copyfileobj(src, dest, READ_CHUNK)
+        metrics.file_done(full_path, time.perf_counter() - start, "compress")
+        if on_member:
+            on_member(zinfo)
+
+def write_zip(members, zip_path, workers=1, settings=None, journal=None):
+    # The archive is built as <zip_path>.partial and only replaces zip_path once complete.
+    # With a journal, a partial archive left by an interrupted run is resumed at its
+    # last checkpoint instead of being rebuilt.
+    settings = settings or zip_settings()
+    partial_path = zip_path + ".partial"
+    resumed, offset = [], 0
+    if journal is not None:
+        if os.path.exists(partial_path):
+            resumed, offset = zip_resume_state(journal.load())
+        if not resumed:
+            journal.clear()
+    with open(partial_path, "r+b" if resumed else "wb") as f:
+        f.seek(offset)
+        f.truncate()
+        with zipfile.ZipFile(f, "w", settings["type"]) as zipf:
+            for record in resumed:
+                zinfo = zipfile.ZipInfo(record["filename"], tuple(record["date_time"]))
+                for field, value in record.items():
+                    if field not in ("filename", "date_time"):
+                        setattr(zinfo, field, value)
+                zipf.filelist.append(zinfo)
+                zipf.NameToInfo[zinfo.filename] = zinfo
+            if resumed:
+                members = (m for m in members if m[1] not in zipf.NameToInfo)
+
+            metrics = current_metrics()
+            members = current_throttle().limit(members, member_size)
+
+            def on_member(zinfo):
+                metrics.count(1, zinfo.file_size)
+                if journal is None:
+                    return
+                journal.add({"member": zipinfo_record(zinfo)})
+                if journal.due():
+                    f.flush()
+                    os.fsync(f.fileno())
+                    journal.add({"offset": zipf.start_dir})
+                    journal.flush()
+
+            if workers > 1 and not precompressed_writes():
+                log_message(f"Parallel zip is not supported on Python {sys.version.split()[0]}, compressing serially")
+                workers = 1
+            if workers > 1:
+                spool_dir = tempfile.mkdtemp(prefix=".zipspool-", dir=os.path.dirname(os.path.abspath(zip_path)))
+                try:
+                    parallel_zip(members, zipf, workers, settings, spool_dir, on_member)
+                finally:
+                    shutil.rmtree(spool_dir, ignore_errors=True)
+            else:
+                serial_zip(members, zipf, settings, on_member)
+    os.replace(partial_path, zip_path)
+    if journal is not None:
+        journal.clear()
+    return len(resumed)